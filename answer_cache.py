@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+
+# 语义答案缓存：按问题向量的余弦相似度命中（只匹配同一回答语言的条目），LRU + TTL 淘汰，SQLite 持久化
+class SemanticAnswerCache:
+    def __init__(self, path: str, threshold: float = 0.95, max_entries: int = 1000, ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.threshold = threshold  # 余弦相似度阈值
+        self.max_entries = max_entries
+        self.ttl = ttl  # 条目有效期（秒）
+        self.kb_version = None  # 当前知识库版本，版本变化时清空缓存
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0  # 命中缓存节省的生成时间
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # id -> {question, answer, language, latency, created}，按最近使用排序
+        self._ids = []  # 与 _matrix 的行一一对应
+        self._matrix = None  # 已归一化的问题向量，懒构建
+        self._languages = None  # 与 _matrix 的行对应的回答语言
+        self._vectors = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                language TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                latency REAL NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                kb_version TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def set_kb_version(self, kb_version: str):
+        """切换知识库版本，加载该版本的持久化条目并删除其他版本的条目"""
+        with self._lock:
+            if kb_version == self.kb_version:
+                return
+            self.kb_version = kb_version
+            self._conn.execute("DELETE FROM answers WHERE kb_version != ?", (kb_version,))
+            self._conn.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT id, question, answer, language, vector, latency, created FROM answers ORDER BY last_used ASC"
+            ).fetchall()
+            self._entries.clear()
+            self._vectors.clear()
+            for entry_id, question, answer, language, blob, latency, created in rows:
+                self._entries[entry_id] = {
+                    "question": question, "answer": answer, "language": language, "latency": latency, "created": created
+                }
+                self._vectors[entry_id] = np.frombuffer(blob, dtype=np.float32)
+            self._matrix = None
+
+    def lookup(self, vector: List[float], language: str = None) -> Optional[str]:
+        """查找相似问题的缓存答案，只匹配回答语言相同的条目（中英文的同一问题向量相近，但答案语言不同），未命中返回 None"""
+        query = self._normalize(vector)
+        with self._lock:
+            self._expire()
+            if self._entries:
+                if self._matrix is None:
+                    self._ids = list(self._vectors)
+                    self._matrix = np.stack([self._vectors[i] for i in self._ids])
+                    self._languages = np.array([self._entries[i]["language"] for i in self._ids])
+                scores = np.where(self._languages == (language or ""), self._matrix @ query, -np.inf)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = self._ids[best]
+                    entry = self._entries[entry_id]
+                    self._entries.move_to_end(entry_id)
+                    self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+                    self._conn.commit()
+                    self.hits += 1
+                    self.saved_seconds += entry["latency"]
+                    return entry["answer"]
+            self.misses += 1
+            return None
+
+    def put(self, question: str, vector: List[float], answer: str, latency: float, language: str = None):
+        """写入新答案，latency 为生成该答案实际花费的时间，language 为回答所用的界面语言"""
+        array = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            if self.kb_version is None:
+                return
+            cursor = self._conn.execute(
+                "INSERT INTO answers (question, answer, language, vector, latency, created, last_used, kb_version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (question, answer, language or "", array.tobytes(), latency, now, now, self.kb_version)
+            )
+            entry_id = cursor.lastrowid
+            self._entries[entry_id] = {
+                "question": question, "answer": answer, "language": language or "", "latency": latency, "created": now
+            }
+            self._vectors[entry_id] = array
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self._conn.commit()
+            self._matrix = None
+
+    def clear(self):
+        """清空所有缓存条目"""
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+            self._entries.clear()
+            self._vectors.clear()
+            self._matrix = None
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expire(self):
+        """删除超过有效期的条目（调用方持有锁）"""
+        deadline = time.time() - self.ttl
+        expired = [entry_id for entry_id, entry in self._entries.items() if entry["created"] < deadline]
+        for entry_id in expired:
+            self._remove(entry_id)
+        if expired:
+            self._conn.commit()
+            self._matrix = None
+
+    def _remove(self, entry_id: int):
+        del self._entries[entry_id]
+        del self._vectors[entry_id]
+        self._conn.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+        self._matrix = None
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm > 0 else array
@@ -0,0 +1,131 @@
+"""
+向量压缩基准测试
+
+在本仓库语料的真实向量上比较不同存储精度（float32 / float16 / int8）和降维方式（PCA / 随机投影）的
+内存占用、磁盘占用、加载耗时（内存映射 / 完整读入）、查询延迟和 recall@k（以 float32 精确检索结果为基准），
+用实测数据选择适合目标机器内存的压缩级别，再通过 index_params 的 encoding / reduce_dim / reduce_method
+或 python cli.py build --encoding int8 --reduce-dim 1024 使用。
+不需要连接 Ollama：向量直接取自已构建的 vector_store/（须为未压缩、未降维的版本）或向量缓存。
+
+用法：
+    python benchmarks/compression_benchmark.py
+    python benchmarks/compression_benchmark.py --configs float32,float16,int8,int8+pca/1024,float16+random/512
+    python benchmarks/compression_benchmark.py --source cache --model llama2 --index-type hnsw --json compression.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from index_benchmark import load_vectors_from_store, load_vectors_from_cache, make_queries
+from vector_index import INDEX_TYPES, build_index, index_size_bytes, read_index, write_index, configure_search
+
+DEFAULT_CONFIGS = "float32,float16,int8,float16+pca/1024,int8+pca/1024,int8+pca/512,int8+random/1024"
+
+
+def parse_config(config):
+    """解析 "int8+pca/1024" 形式的配置为 index_params"""
+    encoding, _, reduction = config.partition("+")
+    params = {"encoding": encoding}
+    if reduction:
+        method, _, dim = reduction.partition("/")
+        params.update(reduce_method=method, reduce_dim=int(dim))
+    return params
+
+
+def benchmark(config, index_type, vectors, queries, k, exact, workdir):
+    params = parse_config(config)
+    if params.get("reduce_dim", 0) >= vectors.shape[1]:
+        return None
+    start = time.perf_counter()
+    index = build_index(vectors, index_type, params)
+    build_seconds = time.perf_counter() - start
+
+    path = os.path.join(workdir, f"{config.replace('/', '_')}.faiss")
+    write_index(index, path)
+    load_seconds = {}
+    for mode, mmap in (("mmap", True), ("full", False)):
+        start = time.perf_counter()
+        loaded = read_index(path, mmap=mmap)
+        load_seconds[mode] = time.perf_counter() - start
+    configure_search(loaded, params)
+
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        _, positions = loaded.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(positions[0])
+    recall = float(np.mean([len(set(found) & set(expected)) / k for found, expected in zip(results, exact)]))
+
+    memory_bytes = index_size_bytes(index)
+    return {
+        "config": config,
+        "build_seconds": round(build_seconds, 3),
+        "memory_mb": round(memory_bytes / 1024 / 1024, 2),
+        "bytes_per_vector": round(memory_bytes / len(vectors), 1),
+        "disk_mb": round(os.path.getsize(path) / 1024 / 1024, 2),
+        "load_ms_mmap": round(load_seconds["mmap"] * 1000, 2),
+        "load_ms_full": round(load_seconds["full"] * 1000, 2),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 3),
+        f"recall@{k}": round(recall, 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较不同向量压缩方式的内存、磁盘、加载耗时和召回率")
+    parser.add_argument("--source", choices=["vector_store", "cache"], default="vector_store", help="向量来源")
+    parser.add_argument("--store", default="vector_store", help="向量存储目录")
+    parser.add_argument("--cache", default="embedding_cache.sqlite", help="向量缓存文件")
+    parser.add_argument("--model", default="llama2", help="从缓存读取时使用的向量模型")
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS, help="要比较的配置，逗号分隔，格式为 精度[+降维方式/维度]")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="索引类型")
+    parser.add_argument("--queries", type=int, default=200, help="查询数")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 中的 k")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    if args.source == "vector_store":
+        vectors = load_vectors_from_store(args.store)
+    else:
+        vectors = load_vectors_from_cache(args.cache, args.model)
+    queries = make_queries(vectors, args.queries, args.seed)
+    print(f"向量数：{len(vectors)}，维度：{vectors.shape[1]}，查询数：{len(queries)}，k={args.k}，索引类型：{args.index_type}")
+
+    # float32 精确检索结果作为召回率基准
+    _, exact = build_index(vectors, "flat").search(queries, args.k)
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for config in args.configs.split(","):
+            row = benchmark(config.strip(), args.index_type, vectors, queries, args.k, exact, workdir)
+            if row is None:
+                print(f"跳过 {config}：降维后的维度不小于原始维度")
+                continue
+            rows.append(row)
+
+    headers = list(rows[0].keys())
+    print("\t".join(headers))
+    for row in rows:
+        print("\t".join(str(row[header]) for header in headers))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "vectors": len(vectors),
+                "dim": int(vectors.shape[1]),
+                "queries": len(queries),
+                "k": args.k,
+                "index_type": args.index_type,
+                "results": rows
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+FAISS 索引类型基准测试
+
+在本仓库语料的真实向量上比较 flat / ivf / hnsw / pq 四种索引的构建时间、内存、
+单条查询延迟和 recall@k（以 flat 精确检索结果为基准），用实测数据选择索引类型。
+不需要连接 Ollama：向量直接取自已构建的 vector_store/（须为未压缩、未降维的版本）或向量缓存。
+
+用法：
+    python benchmarks/index_benchmark.py
+    python benchmarks/index_benchmark.py --source cache --model llama2 --queries 500 --k 10
+    python benchmarks/index_benchmark.py --nprobe 32 --ef-search 128 --json index_benchmark.json
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vector_index import DEFAULT_INDEX_PARAMS, INDEX_TYPES, build_index, index_size_bytes
+from snapshot_store import SnapshotStore
+
+
+def load_vectors_from_store(store_path):
+    """从当前快照版本的 <分片>/index.faiss 读取所有向量（只读取 FAISS 索引，不反序列化 docstore）
+
+    以 pq、float16 / int8 或降维构建的版本只能还原出有损的近似向量，不能作为精确检索的基准，直接退出并提示改用向量缓存
+    """
+    arrays = []
+    store_path = SnapshotStore(store_path).current_path() or store_path
+    index_info_path = os.path.join(store_path, "index_info.json")
+    if os.path.exists(index_info_path):
+        with open(index_info_path, "r", encoding="utf-8") as f:
+            index_info = json.load(f)
+        params = {**DEFAULT_INDEX_PARAMS, **index_info.get("index_params", {})}
+        if index_info.get("index_type") == "pq" or params["encoding"] != "float32" or params["reduce_dim"]:
+            raise SystemExit(
+                f"{store_path} 以有损方式构建（索引类型 {index_info.get('index_type')}，精度 {params['encoding']}，"
+                f"降维 {params['reduce_dim'] or '无'}），无法还原原始向量，请使用 --source cache 从向量缓存读取"
+            )
+    for name in sorted(os.listdir(store_path)):
+        index_path = os.path.join(store_path, name, "index.faiss")
+        if os.path.exists(index_path):
+            index = faiss.read_index(index_path)
+            arrays.append(index.reconstruct_n(0, index.ntotal))
+    if not arrays:
+        raise SystemExit(f"{store_path} 中没有找到索引分片，请先构建向量存储")
+    return np.vstack(arrays).astype(np.float32)
+
+
+def load_vectors_from_cache(cache_path, model):
+    """从向量缓存读取指定模型的所有向量"""
+    conn = sqlite3.connect(cache_path)
+    rows = conn.execute("SELECT vector FROM embeddings WHERE model = ?", (model,)).fetchall()
+    conn.close()
+    if not rows:
+        raise SystemExit(f"{cache_path} 中没有模型 {model} 的向量")
+    return np.vstack([np.frombuffer(blob, dtype=np.float32) for (blob,) in rows])
+
+
+def make_queries(vectors, count, seed):
+    """从语料中抽样并加入少量噪声作为查询向量，模拟与文档相近但不完全相同的问题"""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)
+    noise = rng.normal(0, vectors.std() * 0.1, size=(len(picks), vectors.shape[1]))
+    return (vectors[picks] + noise).astype(np.float32)
+
+
+def benchmark(index_type, vectors, queries, k, params, exact):
+    start = time.perf_counter()
+    index = build_index(vectors, index_type, params)
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        _, positions = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(positions[0])
+
+    if exact is None:
+        recall = 1.0
+    else:
+        recall = float(np.mean([
+            len(set(found) & set(expected)) / k for found, expected in zip(results, exact)
+        ]))
+
+    return {
+        "index_type": index_type,
+        "build_seconds": round(build_seconds, 3),
+        "size_mb": round(index_size_bytes(index) / 1024 / 1024, 2),
+        "latency_ms_mean": round(float(np.mean(latencies)), 3),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 3),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 3),
+        f"recall@{k}": round(recall, 4)
+    }, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较不同 FAISS 索引类型的构建时间、内存、查询延迟和召回率")
+    parser.add_argument("--source", choices=["vector_store", "cache"], default="vector_store", help="向量来源")
+    parser.add_argument("--store", default="vector_store", help="向量存储目录")
+    parser.add_argument("--cache", default="embedding_cache.sqlite", help="向量缓存文件")
+    parser.add_argument("--model", default="llama2", help="从缓存读取时使用的向量模型")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="要测试的索引类型，逗号分隔")
+    parser.add_argument("--queries", type=int, default=200, help="查询数")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 中的 k")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--nprobe", type=int)
+    parser.add_argument("--hnsw-m", type=int)
+    parser.add_argument("--ef-construction", type=int)
+    parser.add_argument("--ef-search", type=int)
+    parser.add_argument("--pq-m", type=int)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    if args.source == "vector_store":
+        vectors = load_vectors_from_store(args.store)
+    else:
+        vectors = load_vectors_from_cache(args.cache, args.model)
+    queries = make_queries(vectors, args.queries, args.seed)
+    params = {
+        key: value for key, value in {
+            "nlist": args.nlist,
+            "nprobe": args.nprobe,
+            "hnsw_m": args.hnsw_m,
+            "ef_construction": args.ef_construction,
+            "ef_search": args.ef_search,
+            "pq_m": args.pq_m
+        }.items() if value is not None
+    }
+    print(f"向量数：{len(vectors)}，维度：{vectors.shape[1]}，查询数：{len(queries)}，k={args.k}")
+
+    # flat 精确检索结果作为召回率基准
+    baseline, exact = benchmark("flat", vectors, queries, args.k, params, None)
+    rows = []
+    for index_type in args.types.split(","):
+        index_type = index_type.strip()
+        if index_type == "flat":
+            rows.append(baseline)
+        else:
+            rows.append(benchmark(index_type, vectors, queries, args.k, params, exact)[0])
+
+    headers = list(rows[0].keys())
+    print("\t".join(headers))
+    for row in rows:
+        print("\t".join(str(row[header]) for header in headers))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "vectors": len(vectors),
+                "dim": int(vectors.shape[1]),
+                "queries": len(queries),
+                "k": args.k,
+                "params": params,
+                "results": rows
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
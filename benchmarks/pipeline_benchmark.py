@@ -0,0 +1,255 @@
+"""
+索引构建与问答延迟基准测试
+
+在仓库自带的 assets/ 语料上分别测量：文档加载、分割、向量化吞吐（冷/热缓存）、索引构建与磁盘占用、
+流式构建总耗时、从磁盘加载耗时、检索延迟（p50/p95/p99）和 ChatbotWithRetrieval.query() 端到端延迟。
+Ollama 由单独进程中的 ollama_stub 替身服务代替（确定性伪向量和伪回答，不与被测代码争用 GIL），只需 CPU、不需要网络，
+结果写入 JSON，便于在不同提交之间对比分块大小、k 值和索引类型的影响。
+
+用法：
+    python benchmarks/pipeline_benchmark.py
+    python benchmarks/pipeline_benchmark.py --index-type hnsw --json hnsw.json
+    python benchmarks/pipeline_benchmark.py --embed-latency 0.005 --token-latency 0.01 --e2e-queries 20
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from answer_cache import SemanticAnswerCache
+from knowledge_base import ChatbotWithRetrieval, KnowledgeBase, PartitionBuilder
+from vector_index import INDEX_TYPES
+
+
+@contextmanager
+def stub_server(args):
+    """在子进程中启动 Ollama 替身服务，返回其地址"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "ollama_stub.py"),
+        "--port", str(port),
+        "--dim", str(args.dim),
+        "--embed-latency", str(args.embed_latency),
+        "--token-latency", str(args.token_latency),
+        "--tokens", str(args.tokens)
+    ], stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 10
+        while True:
+            try:
+                requests.get(url, timeout=1)
+                break
+            except requests.ConnectionError:
+                if time.time() > deadline or process.poll() is not None:
+                    raise RuntimeError("替身服务启动失败")
+                time.sleep(0.05)
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def percentiles(samples_ms):
+    return {
+        "mean": round(float(np.mean(samples_ms)), 3),
+        "p50": round(float(np.percentile(samples_ms, 50)), 3),
+        "p95": round(float(np.percentile(samples_ms, 95)), 3),
+        "p99": round(float(np.percentile(samples_ms, 99)), 3)
+    }
+
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, file))
+        for root, _, files in os.walk(path)
+        for file in files
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_questions(splits, count, seed):
+    """从片段的标题路径中抽样生成问题，返回 [(问题, 语言)]，同一 seed 结果固定"""
+    rng = np.random.default_rng(seed)
+    candidates = [split for split in splits if split.metadata.get("headings")]
+    picks = rng.choice(len(candidates), size=min(count, len(candidates)), replace=False)
+    questions = []
+    for pick in picks:
+        split = candidates[int(pick)]
+        heading = split.metadata["headings"].split(" > ")[-1]
+        language = split.metadata["language"]
+        questions.append((f"{heading} 怎么用？" if language == "zh" else f"How to use {heading}?", language))
+    return questions
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run(args, workdir, stub_url):
+    bot = ChatbotWithRetrieval(args.data, auto_load=False)
+    bot.base_url = stub_url
+    bot.llm_client.base_url = stub_url
+    bot.index_type = args.index_type
+    bot.answer_cache = SemanticAnswerCache(os.path.join(workdir, "answer_cache.sqlite"))
+    bot.embedding_cache_path = os.path.join(workdir, "embedding_cache_stages.sqlite")
+    bot.embeddings = bot.create_embeddings(stub_url)
+    results = {}
+
+    # 逐阶段测量（串行），便于定位瓶颈
+    # 与构建使用同一个 load_and_split，读取和分割的耗时取其中 build.load / build.split 计时区间的累计值
+    file_paths, scan_seconds = timed(bot.scan_files)
+    bot.metrics.enabled = True
+    bot.metrics.reset()
+    splits = [split for _, _, file_splits, _, _ in map(bot.load_and_split, file_paths) for split in file_splits or []]
+    stages = bot.metrics.snapshot()["stages"]
+    load_seconds = stages["build.load"]["sum"]
+    split_seconds = stages["build.split"]["sum"]
+    for split in splits:
+        split.id = str(uuid.uuid4())
+    corpus_bytes = sum(os.path.getsize(path) for path in file_paths)
+    results["corpus"] = {"files": len(file_paths), "bytes": corpus_bytes, "chunks": len(splits)}
+    results["load"] = {"seconds": round(scan_seconds + load_seconds, 3), "mb_per_second": round(corpus_bytes / 1024 / 1024 / (scan_seconds + load_seconds), 2)}
+    results["split"] = {"seconds": round(split_seconds, 3), "chunks_per_second": round(len(splits) / split_seconds, 1)}
+
+    texts = [split.page_content for split in splits]
+    vectors, cold_seconds = timed(bot.embeddings.embed_documents, texts)
+    _, warm_seconds = timed(bot.embeddings.embed_documents, texts)
+    results["embedding"] = {
+        "dim": len(vectors[0]),
+        "cold_seconds": round(cold_seconds, 3),
+        "cold_chunks_per_second": round(len(texts) / cold_seconds, 1),
+        "warm_seconds": round(warm_seconds, 3),
+        "warm_chunks_per_second": round(len(texts) / warm_seconds, 1)
+    }
+
+    workspace = bot.snapshots.workspace()
+
+    def build_partitions():
+        builders = {}
+        for name, group in bot.group_by_shard(zip(splits, vectors)).items():
+            builders[name] = PartitionBuilder(bot.embeddings, bot.index_type, bot.index_params, os.path.join(workspace, name))
+            builders[name].add([split for split, _ in group], [vector for _, vector in group])
+        return {name: builder.finish() for name, builder in builders.items()}
+
+    partitions, build_seconds = timed(build_partitions)
+    bot.swap(KnowledgeBase(partitions, {}, workspace=workspace))
+    _, save_seconds = timed(bot.save_vectorstore)
+    results["index"] = {
+        "index_type": bot.index_type,
+        "build_seconds": round(build_seconds, 3),
+        "save_seconds": round(save_seconds, 3),
+        "disk_bytes": directory_size(bot.kb.path),
+        "vectors": sum(int(partition.vectorstore.index.ntotal) for partition in partitions.values())
+    }
+
+    # 流式构建：各阶段重叠执行，使用新的向量缓存测量冷启动总耗时
+    bot.embedding_cache_path = os.path.join(workdir, "embedding_cache_pipeline.sqlite")
+    bot.embeddings = bot.create_embeddings(stub_url)
+    kb, pipeline_seconds = timed(bot.build_knowledge_base, file_paths)
+    bot.swap(kb)
+    bot.save_vectorstore()
+    results["pipeline"] = {
+        "cold_seconds": round(pipeline_seconds, 3),
+        "stage_sum_seconds": round(scan_seconds + load_seconds + split_seconds + cold_seconds + build_seconds, 3)
+    }
+
+    # 以服务方式（只读内存映射）重新加载
+    kb, open_seconds = timed(bot.read_knowledge_base)
+    bot.swap(kb)
+    results["open"] = {"seconds": round(open_seconds, 3)}
+
+    questions = make_questions(splits, args.queries, args.seed)
+    question_vectors = [bot.embeddings.embed_query(question) for question, _ in questions]
+    latencies = []
+    for (question, language), vector in zip(questions, question_vectors):
+        start = time.perf_counter()
+        bot.retrieve(question, vector, kb, language)
+        latencies.append((time.perf_counter() - start) * 1000)
+    results["retrieval_ms"] = dict(percentiles(latencies), queries=len(latencies), k=bot.retrieval_k, fetch_k=bot.hybrid_fetch_k)
+
+    bot.answer_cache.clear()
+    latencies = []
+    for question, language in questions[:args.e2e_queries]:
+        start = time.perf_counter()
+        answer = bot.query(question, language)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if answer.startswith("发生错误"):
+            raise RuntimeError(answer)
+    results["query_ms"] = dict(percentiles(latencies), queries=len(latencies))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量文档加载、分割、向量化、索引构建、检索和端到端问答的耗时")
+    parser.add_argument("--data", default=os.path.join(ROOT, "assets"), help="文档目录")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--queries", type=int, default=200, help="检索延迟测量的问题数")
+    parser.add_argument("--e2e-queries", type=int, default=50, help="端到端问答测量的问题数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dim", type=int, default=256, help="替身服务的伪向量维度")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="替身服务每次向量化的延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="替身服务每个 token 的生成间隔（秒）")
+    parser.add_argument("--tokens", type=int, default=32, help="替身服务每个回答的 token 数")
+    parser.add_argument("--json", default="pipeline_benchmark.json", help="结果 JSON 文件")
+    args = parser.parse_args()
+    args.data = os.path.abspath(args.data)
+    output = os.path.abspath(args.json)
+
+    cwd = os.getcwd()
+    with stub_server(args) as stub_url, tempfile.TemporaryDirectory() as workdir:
+        # 向量存储、缓存等相对路径都落在临时目录，不影响仓库中已有的数据
+        os.chdir(workdir)
+        try:
+            results = run(args, workdir, stub_url)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "index_type": args.index_type,
+            "queries": args.queries,
+            "e2e_queries": args.e2e_queries,
+            "seed": args.seed,
+            "stub": {"dim": args.dim, "embed_latency": args.embed_latency, "token_latency": args.token_latency, "tokens": args.tokens}
+        },
+        "results": results
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for stage, values in results.items():
+        print(f"{stage}\t" + "\t".join(f"{key}={value}" for key, value in values.items()))
+    print(f"结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,13 @@
 import os
-import streamlit as st
-from langchain_community.document_loaders import TextLoader
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
-from langchain_ollama import OllamaLLM
-import requests
+import threading
 import time
+import streamlit as st
 from datetime import datetime
-from typing import Dict, List
+from knowledge_base import ChatbotWithRetrieval
+from reporter import Reporter
+from metrics import serve_metrics
+from scheduler import RequestCancelled
+from conversation import ConversationMemory
 
 # 语言配置
 TRANSLATIONS = {
@@ -31,6 +29,7 @@ TRANSLATIONS = {
         "export_filename": "对话记录",
         "input_required": "请输入问题",
         "thinking": "正在思考...",
+        "queued": "服务繁忙，正在排队，前面还有 {ahead} 个请求...",
         "features_title": "功能按钮说明",
         "features": {
             "new_chat": "开始一个全新的对话",
@@ -53,8 +52,22 @@ TRANSLATIONS = {
         ],
         "system_info_title": " 系统信息",
         "docs_loaded": "已加载文档数",
+        "snapshot_version": "索引版本",
+        "embedding_model": "向量模型",
+        "migration_progress": "向量模型迁移",
         "chat_id": "当前对话ID",
+        "follow_up_mode": "💬 多轮对话（结合上文理解追问）",
+        "search_sections": "📚 检索范围（不选则检索全部栏目）",
+        "memory_tokens": "对话记忆",
         "system_status": "系统状态",
+        "answer_cache_hit_rate": "答案缓存命中率",
+        "answer_cache_saved": "缓存节省时间",
+        "latency_title": "各阶段耗时",
+        "stage": "阶段",
+        "samples": "次数",
+        "tokens_per_second": "生成速度",
+        "embedding_cache_hit_rate": "向量缓存命中率",
+        "metrics_download": "导出指标",
         "initializing": "正在初始化..."
     },
     "en": {
@@ -75,6 +88,7 @@ TRANSLATIONS = {
         "export_filename": "chat_history",
         "input_required": "Please enter a question",
         "thinking": "Thinking...",
+        "queued": "Server busy, waiting in queue ({ahead} requests ahead)...",
         "features_title": "Features",
         "features": {
             "new_chat": "Start a new conversation",
@@ -97,8 +111,22 @@ TRANSLATIONS = {
         ],
         "system_info_title": "System Info",
         "docs_loaded": "Documents Loaded",
+        "snapshot_version": "Index Snapshot",
+        "embedding_model": "Embedding Model",
+        "migration_progress": "Embedding Migration",
         "chat_id": "Chat ID",
+        "follow_up_mode": "💬 Follow-up mode (use conversation context)",
+        "search_sections": "📚 Sections to search (all if empty)",
+        "memory_tokens": "Conversation Memory",
         "system_status": "System Status",
+        "answer_cache_hit_rate": "Answer Cache Hit Rate",
+        "answer_cache_saved": "Time Saved by Cache",
+        "latency_title": "Stage Latency",
+        "stage": "Stage",
+        "samples": "Count",
+        "tokens_per_second": "Generation Speed",
+        "embedding_cache_hit_rate": "Embedding Cache Hit Rate",
+        "metrics_download": "Export Metrics",
         "initializing": "Initializing..."
     }
 }
@@ -317,355 +345,62 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# 自定义文本加载器，适配文件编码问题
-class CustomTextLoader(TextLoader):
-    def __init__(self, file_path: str, encoding: str = "utf-8"):
-        super().__init__(file_path, encoding=encoding)
+# 把构建过程中的消息输出到 Streamlit：普通消息在侧边栏，醒目消息在主区域，进度在固定占位中原地刷新
+class StreamlitReporter(Reporter):
+    def __init__(self, target=None):
+        super().__init__()
+        self.target = target or st.sidebar
+        self.main = self if self.target is st else StreamlitReporter(st)
+        self._placeholders = {}
 
-    def load(self):
-        try:
-            return super().load()
-        except UnicodeDecodeError:
-            return super().__init__(self.file_path, encoding="gbk").load()
-
-def check_ollama_service():
-    """检查 Ollama 服务是否可用"""
-    try:
-        # 尝试多个端点
-        endpoints = [
-            "http://127.0.0.1:11434",
-            "http://localhost:11434",
-            "http://[::1]:11434"
-        ]
-        
-        st.sidebar.write("正在检查 Ollama 服务...")
-        
-        for endpoint in endpoints:
-            try:
-                st.sidebar.write(f"尝试连接: {endpoint}")
-                # 先尝试基础连接
-                response = requests.get(f"{endpoint}/", timeout=5)
-                st.sidebar.write(f"基础连接响应: {response.status_code}")
-                
-                # 再尝试 API 端点
-                api_response = requests.post(
-                    f"{endpoint}/api/embeddings",
-                    json={"model": "llama2", "prompt": "test"},
-                    timeout=5
-                )
-                st.sidebar.write(f"API 响应: {api_response.status_code}")
-                
-                if api_response.status_code == 200:
-                    st.sidebar.success(f"成功连接到 {endpoint}")
-                    return True
-            except Exception as e:
-                st.sidebar.warning(f"连接 {endpoint} 失败: {str(e)}")
-                continue
-                
-        st.sidebar.error("所有连接尝试均失败")
-        return False
-    except Exception as e:
-        st.sidebar.error(f"检查服务时出错：{str(e)}")
-        return False
-
-def check_model_available(model_name="llama2"):
-    """检查模型是否已下载"""
-    try:
-        endpoints = [
-            "http://127.0.0.1:11434",
-            "http://localhost:11434",
-            "http://[::1]:11434"
-        ]
-        
-        st.sidebar.write("正在检查模型状态...")
-        
-        for endpoint in endpoints:
-            try:
-                # 尝试直接使用模型
-                response = requests.post(
-                    f"{endpoint}/api/embeddings",
-                    json={"model": model_name, "prompt": "test"},
-                    timeout=5
-                )
-                
-                if response.status_code == 200:
-                    st.sidebar.success(f"模型 {model_name} 可用")
-                    return True
-                elif response.status_code == 404:
-                    st.sidebar.warning(f"模型 {model_name} 未找到")
-                else:
-                    st.sidebar.warning(f"检查模型时收到意外响应: {response.status_code}")
-                    
-            except Exception as e:
-                st.sidebar.warning(f"检查模型时出错: {str(e)}")
-                continue
-                
-        return False
-    except Exception as e:
-        st.sidebar.error(f"检查模型时出错：{str(e)}")
-        return False
+    def write(self, message: str):
+        self.target.write(message)
 
-# 用于处理文档加载、文本分割和向量存储
-class ChatbotWithRetrieval:
-    def __init__(self, data_folder: str):
-        self.data_folder = data_folder
-        self.documents = None
-        self.vectorstore = None
-        self.qa_chain = None
-        self.embeddings = None
-        self.vector_store_path = "vector_store"  # 向量存储保存路径
-        
-        # 尝试加载现有的向量存储
-        if self.load_existing_vectorstore():
-            st.sidebar.success("已加载现有向量存储")
-        else:
-            self.initialize_bot()
-
-    def load_existing_vectorstore(self):
-        """尝试加载现有的向量存储"""
-        try:
-            if os.path.exists(self.vector_store_path):
-                # 配置 embeddings
-                base_url = "http://127.0.0.1:11434"
-                self.embeddings = OllamaEmbeddings(
-                    model="llama2",
-                    base_url=base_url
-                )
-                
-                # 加载向量存储，允许反序列化
-                self.vectorstore = FAISS.load_local(
-                    self.vector_store_path,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
-                
-                # 创建问答链
-                self.qa_chain = self.create_qa_chain(base_url)
-                return True
-            return False
-        except Exception as e:
-            st.sidebar.warning(f"加载现有向量存储失败：{str(e)}")
-            return False
+    def info(self, message: str):
+        self.target.info(message)
 
-    def save_vectorstore(self):
-        """保存向量存储到本地"""
-        try:
-            if self.vectorstore:
-                self.vectorstore.save_local(self.vector_store_path)
-                st.sidebar.success("向量存储已保存到本地")
-        except Exception as e:
-            st.sidebar.error(f"保存向量存储失败：{str(e)}")
+    def success(self, message: str):
+        self.target.success(message)
 
-    def initialize_bot(self):
-        """初始化机器人的所有组件"""
-        try:
-            # 检查 Ollama 服务
-            if not check_ollama_service():
-                st.error("Ollama 服务未运行！")
-                st.info("""
-                ### 请按以下步骤操作：
-                1. 打开新的命令行窗口（以管理员身份运行）
-                2. 运行以下命令停止现有服务：
-                   ```
-                   taskkill /F /IM ollama.exe
-                   ```
-                3. 等待几秒后重新启动服务：
-                   ```
-                   ollama serve
-                   ```
-                4. 在新窗口中测试服务：
-                   ```
-                   curl http://127.0.0.1:11434/
-                   ```
-                5. 如果测试成功，刷新此页面
-                
-                如果还是不行：
-                1. 检查任务管理器中是否有多个 ollama 进程
-                2. 检查端口 11434 是否被占用
-                3. 尝试重启电脑后重试
-                """)
-                return
-            
-            if not check_model_available("llama2"):
-                st.error("llama2 模型未找到！")
-                st.info("""
-                ### 请按以下步骤操作：
-                1. 确保 Ollama 服务正在运行
-                2. 在新的命令行窗口中运行：
-                   ```
-                   ollama pull llama2
-                   ```
-                3. 等待下载完成（保持窗口开着）
-                4. 下载完成后运行：
-                   ```
-                   ollama list
-                   ```
-                5. 确认看到 llama2 后刷新此页面
-                """)
-                return
-
-            st.success("Ollama 服务正常运行")
-            st.info("正在初始化机器人...")
-            
-            # 配置 embeddings
-            base_url = "http://127.0.0.1:11434"
-            self.embeddings = OllamaEmbeddings(
-                model="llama2",
-                base_url=base_url
-            )
-            
-            st.info("正在加载文档...")
-            self.documents = self.load_documents()
-            if not self.documents:
-                st.error("未找到任何文档！")
-                return
-            st.success(f"已加载 {len(self.documents)} 个文档")
-            
-            st.info("正在创建向量存储...")
-            self.vectorstore = self.create_vectorstore()
-            
-            # 保存向量存储到本地
-            self.save_vectorstore()
-            
-            st.info("正在初始化问答链...")
-            self.qa_chain = self.create_qa_chain(base_url)
-            
-        except Exception as e:
-            st.error(f"初始化失败：{str(e)}")
-            st.info("""
-            ### 请尝试以下解决方案：
-            1. 检查 Ollama 服务状态
-            2. 确保网络连接正常
-            3. 重启应用
-            4. 查看详细错误信息
-            """)
-            raise e
-
-    def load_documents(self):
-        """加载文档"""
-        documents = []
-        processed_files = set()  # 用于跟踪已处理的文件
-        
-        # 指定要加载的目录
-        target_dirs = [
-            os.path.join(self.data_folder, "guide"),
-            os.path.join(self.data_folder, "api"),
-            os.path.join(self.data_folder, "faq")
-        ]
-        
-        st.sidebar.write("🔍 开始搜索文档...")
-        
-        # 只处理指定目录中的 .md 文件
-        for target_dir in target_dirs:
-            if not os.path.exists(target_dir):
-                st.sidebar.warning(f"目录不存在：{target_dir}")
-                continue
-            
-            for root, dirs, files in os.walk(target_dir):
-                for file in files:
-                    if not file.endswith(".md"):
-                        continue
-                        
-                    file_path = os.path.join(root, file)
-                    
-                    # 跳过项目自身的 README.md
-                    if file.lower() == "readme.md" and "assets" in file_path.split(os.sep)[-2:]:
-                        continue
-                    
-                    # 检查文件是否已处理
-                    if file_path in processed_files:
-                        st.sidebar.info(f"跳过重复文件：{file}")
-                        continue
-                        
-                    try:
-                        st.sidebar.info(f"正在加载：{file}")
-                        loader = CustomTextLoader(file_path)
-                        docs = loader.load()
-                        documents.extend(docs)
-                        processed_files.add(file_path)
-                        st.sidebar.success(f"已加载：{file}")
-                    except Exception as e:
-                        st.sidebar.error(f"加载失败 {file}：{str(e)}")
-                        continue
-        
-        if not documents:
-            st.error("""
-            ### 未找到任何文档！
-            
-            请确保以下目录中包含 .md 文件：
-            - assets/guide/
-            - assets/api/
-            - assets/faq/
-            
-            当前搜索路径：{}
-            """.format([os.path.abspath(d) for d in target_dirs]))
-            raise Exception("未找到任何支持的文档文件")
-            
-        st.sidebar.success(f"共加载了 {len(documents)} 个文档")
-        return documents
+    def warning(self, message: str):
+        self.target.warning(message)
 
-    def create_vectorstore(self):
-        """创建向量存储"""
-        try:
-            st.sidebar.info("正在处理文档...")
-            # 文本分割
-            text_splitter = CharacterTextSplitter(
-                chunk_size=500,  # 减小块大小
-                chunk_overlap=50,
-                separator="\n\n",  # 使用双换行作为分隔符
-                length_function=len,
-                is_separator_regex=False
-            )
-            
-            # 使用集合去重
-            unique_docs = list({doc.page_content: doc for doc in self.documents}.values())
-            st.sidebar.info(f"去重后文档数量：{len(unique_docs)}")
-            
-            # 分批处理文档
-            batch_size = 50  # 减小批处理大小
-            all_splits = []
-            
-            for i in range(0, len(unique_docs), batch_size):
-                batch = unique_docs[i:i + batch_size]
-                splits = text_splitter.split_documents(batch)
-                all_splits.extend(splits)
-                st.sidebar.info(f"已处理 {min(i + batch_size, len(unique_docs))}/{len(unique_docs)} 个文档")
-            
-            st.sidebar.success(f"文档已分割为 {len(all_splits)} 个片段")
-            
-            # 创建向量存储
-            st.sidebar.info("正在创建向量索引...")
-            vectorstore = FAISS.from_documents(all_splits, self.embeddings)
-            st.sidebar.success("向量索引创建完成")
-            
-            return vectorstore
-        except Exception as e:
-            st.sidebar.error(f"创建向量存储失败：{str(e)}")
-            raise e
-
-    def create_qa_chain(self, base_url):
-        """创建问答链"""
-        retriever = self.vectorstore.as_retriever(
-            search_type="similarity", 
-            search_kwargs={"k": 1}
-        )
-        return RetrievalQA.from_chain_type(
-            llm=OllamaLLM(
-                model="llama2",
-                base_url=base_url
-            ),
-            chain_type="stuff",
-            retriever=retriever
-        )
-
-    def query(self, question: str):
-        """处理用户查询"""
-        try:
-            if not self.qa_chain:
-                raise Exception("问答链未初始化")
-            return self.qa_chain.run(question)
-        except Exception as e:
-            return f"发生错误：{str(e)}"
+    def error(self, message: str):
+        self.target.error(message)
+
+    def progress(self, key: str, done: int, total: int, message: str):
+        if key not in self._placeholders:
+            self._placeholders[key] = self.target.empty()
+        self._placeholders[key].info(message)
+
+    def end_progress(self, key: str):
+        self._placeholders.pop(key, None)
+
+# 进程级共享的检索引擎，所有浏览器会话共用同一份索引和模型客户端
+class SharedEngine:
+    def __init__(self, data_folder: str):
+        self.data_folder = data_folder
+        self.lock = threading.Lock()
+        self.bot = None
+
+    def get(self, reporter: Reporter = None):
+        """获取共享的机器人实例，首次调用时创建；创建过程的消息输出到发起的会话（reporter）"""
+        with self.lock:
+            if self.bot is None:
+                # 共享实例不保存任何会话的 reporter，后台线程（热加载、迁移）不调用 st.*
+                bot = ChatbotWithRetrieval(self.data_folder, auto_load=False)
+                with bot.reporting(reporter or Reporter()):
+                    bot.start()
+                self.bot = bot
+                # 设置 METRICS_PORT 时在该端口提供 GET /metrics（Prometheus 文本格式）
+                if os.environ.get("METRICS_PORT"):
+                    serve_metrics(self.bot.metrics, int(os.environ["METRICS_PORT"]))
+            return self.bot
+
+@st.cache_resource
+def get_shared_engine():
+    """每个进程只创建一次引擎容器（容器本身不调用 st.* 以避免缓存回放）"""
+    return SharedEngine("assets")
 
 # Streamlit Web UI
 def main():
@@ -678,6 +413,9 @@ def main():
         st.session_state.conversation_id = 1
     if "language" not in st.session_state:
         st.session_state.language = "zh"
+    if "memory" not in st.session_state:
+        # 每个会话的对话记忆（有 token 上限），与显示用的 messages 分开保存
+        st.session_state.memory = ConversationMemory()
 
     # 添加语言切换
     lang = st.sidebar.radio(
@@ -695,6 +433,18 @@ def main():
     # 获取当前语言
     current_lang = st.session_state.language
 
+    follow_up_mode = st.sidebar.checkbox(get_text("follow_up_mode", current_lang), value=True, key="follow_up_mode")
+    
+    # 获取进程级共享引擎；构建消息输出到本次运行创建的 reporter，只显示在发起的会话中
+    engine = get_shared_engine()
+    reporter = StreamlitReporter()
+    # 按栏目筛选检索范围，如只查 api 和 option
+    sections = st.sidebar.multiselect(
+        get_text("search_sections", current_lang),
+        options=engine.bot.sections_of() if engine.bot else [],
+        key="search_sections"
+    )
+
     # 设置标题
     st.title(get_text("title", current_lang))
 
@@ -709,12 +459,14 @@ def main():
             with tool_col1:
                 if st.button("🔄 " + get_text("new_chat", current_lang), use_container_width=True):
                     st.session_state.messages = []
+                    st.session_state.memory.clear()
                     st.session_state.conversation_id += 1
                     st.rerun()
                     
             with tool_col2:
                 if st.button("🗑️ " + get_text("clear_chat", current_lang), use_container_width=True):
                     st.session_state.messages = []
+                    st.session_state.memory.clear()
                     st.rerun()
                     
             with tool_col3:
@@ -732,21 +484,18 @@ def main():
                         
             with tool_col4:
                 if st.button("⚡ " + get_text("reinit", current_lang), use_container_width=True):
-                    if os.path.exists("vector_store"):
-                        import shutil
-                        shutil.rmtree("vector_store")
-                    if 'bot' in st.session_state:
-                        del st.session_state.bot
+                    # 全量重建并发布新的快照版本后原子替换共享索引，其他会话不受影响
+                    bot = engine.get(reporter)
+                    with bot.reporting(reporter):
+                        bot.rebuild()
                     st.rerun()
                     
             with tool_col5:
                 if st.button("📚 " + get_text("update_kb", current_lang), use_container_width=True):
-                    if os.path.exists("vector_store"):
-                        import shutil
-                        shutil.rmtree("vector_store")
-                    if 'bot' in st.session_state:
-                        del st.session_state.bot
-                    st.session_state.bot = ChatbotWithRetrieval("assets")
+                    # 增量更新：只处理新增、修改和删除的文件
+                    bot = engine.get(reporter)
+                    with bot.reporting(reporter):
+                        bot.update_vectorstore()
                     st.rerun()
 
         # 创建聊天界面
@@ -834,15 +583,59 @@ def main():
 
         # 添加系统信息
         with st.expander(get_text("system_info_title", current_lang), expanded=True):
-            if hasattr(st.session_state, 'bot'):
-                docs_count = len(st.session_state.bot.documents) if st.session_state.bot.documents is not None else 0
+            if engine.bot is not None:
+                docs_count = len(engine.bot.kb.manifest) if engine.bot.kb else 0
+                snapshot_version = (engine.bot.kb.version if engine.bot.kb else None) or "-"
+                embedding_model = engine.bot.kb.embeddings.model if engine.bot.kb and engine.bot.kb.embeddings else "-"
+                migration = engine.bot.migration
+                # 迁移进行中或失败时显示进度（完成后向量模型一行已是新模型）
+                migration_line = ""
+                if migration and (migration["error"] or migration["done"] < migration["total"]):
+                    status = migration["error"] or f"{migration['done']}/{migration['total']}"
+                    migration_line = f"<p>{get_text('migration_progress', current_lang)}: {migration['model']} {status}</p>"
+                answer_cache = engine.bot.answer_cache
                 st.markdown(f"""
                 <div class="status-box">
                     <p>{get_text("docs_loaded", current_lang)}: {docs_count}</p>
+                    <p>{get_text("snapshot_version", current_lang)}: {snapshot_version}</p>
+                    <p>{get_text("embedding_model", current_lang)}: {embedding_model}</p>
+                    {migration_line}
                     <p>{get_text("chat_id", current_lang)}: {st.session_state.conversation_id}</p>
+                    <p>{get_text("memory_tokens", current_lang)}: {st.session_state.memory.tokens()} tokens</p>
+                    <p>{get_text("answer_cache_hit_rate", current_lang)}: {answer_cache.hit_rate:.0%} ({answer_cache.hits}/{answer_cache.hits + answer_cache.misses})</p>
+                    <p>{get_text("answer_cache_saved", current_lang)}: {answer_cache.saved_seconds:.1f}s</p>
                     <p>{get_text("system_status", current_lang)}</p>
                 </div>
                 """, unsafe_allow_html=True)
+                metrics = engine.bot.metrics
+                if metrics.enabled:
+                    snapshot = metrics.snapshot()
+                    if snapshot["stages"]:
+                        st.markdown(f"**{get_text('latency_title', current_lang)}**")
+                        st.dataframe(
+                            [
+                                {
+                                    get_text("stage", current_lang): stage,
+                                    get_text("samples", current_lang): summary["count"],
+                                    "p50 (ms)": round(summary["p50"] * 1000, 1),
+                                    "p95 (ms)": round(summary["p95"] * 1000, 1),
+                                    "p99 (ms)": round(summary["p99"] * 1000, 1)
+                                }
+                                for stage, summary in sorted(snapshot["stages"].items())
+                            ],
+                            hide_index=True,
+                            use_container_width=True
+                        )
+                    speed = snapshot["values"].get("generation_tokens_per_second")
+                    if speed:
+                        st.caption(f"{get_text('tokens_per_second', current_lang)}: p50 {speed['p50']:.1f} tokens/s")
+                    st.caption(f"{get_text('embedding_cache_hit_rate', current_lang)}: {snapshot['gauges'].get('embedding_cache_hit_rate', 0):.0%}")
+                    st.download_button(
+                        "📈 " + get_text("metrics_download", current_lang),
+                        metrics.render_text(),
+                        file_name="metrics.prom",
+                        mime="text/plain"
+                    )
             else:
                 st.markdown(f"""
                 <div class="status-box">
@@ -850,22 +643,57 @@ def main():
                 </div>
                 """, unsafe_allow_html=True)
 
+    # 停止按钮：通知仍在运行的生成中止（Streamlit 重新运行脚本时也会打断旧的流式循环）
+    if stop and "cancel_event" in st.session_state:
+        st.session_state.cancel_event.set()
+
     # 处理提交
     if submit and question:
         try:
-            if 'bot' not in st.session_state:
+            if engine.bot is None:
                 with st.spinner("🤖 " + get_text("initializing", current_lang)):
-                    st.session_state.bot = ChatbotWithRetrieval("assets")
-
-            if hasattr(st.session_state, 'bot'):
-                with st.spinner("🤔 " + get_text("thinking", current_lang)):
-                    if not stop:
-                        response = st.session_state.bot.query(question)
-                        prefix = "问：" if current_lang == "zh" else "Q: "
-                        answer_prefix = "答：" if current_lang == "zh" else "A: "
-                        st.session_state.messages.append(f"{prefix}{question}")
-                        st.session_state.messages.append(f"{answer_prefix}{response}")
-                        st.rerun()
+                    engine.get(reporter)
+
+            if engine.bot is not None:
+                prefix = "问：" if current_lang == "zh" else "Q: "
+                answer_prefix = "答：" if current_lang == "zh" else "A: "
+                cancel_event = threading.Event()
+                st.session_state.cancel_event = cancel_event
+                with chat_container:
+                    placeholder = st.empty()
+                
+                response = ""
+                completed = False
+
+                def show_queue_position(position):
+                    # 排队期间定期刷新位置；会话已结束或重新运行时这里抛出的异常会让请求出队
+                    placeholder.info("⏳ " + get_text("queued", current_lang).format(ahead=position - 1))
+
+                memory = st.session_state.memory if follow_up_mode else None
+                stream = engine.bot.query_stream(question, cancel_event, current_lang, show_queue_position, memory, sections)
+                try:
+                    with st.spinner("🤔 " + get_text("thinking", current_lang)):
+                        for token in stream:
+                            response += token
+                            placeholder.markdown(f'''
+                            <div class="bot-answer">
+                                <div class="message-header">
+                                    <div>🤖 {get_text("assistant_title", current_lang)}</div>
+                                    <div class="timestamp">{datetime.now().strftime("%H:%M")}</div>
+                                </div>
+                                <div class="message-content">{response}▌</div>
+                            </div>
+                            ''', unsafe_allow_html=True)
+                    completed = not cancel_event.is_set()
+                except RequestCancelled:
+                    # 排队期间点击了停止
+                    pass
+                finally:
+                    # 关闭生成器会断开与 Ollama 的连接，停止后台生成；已生成的部分仍记入对话
+                    stream.close()
+                    st.session_state.messages.append(f"{prefix}{question}")
+                    st.session_state.messages.append(f"{answer_prefix}{response}" + ("" if completed else " ⏹️"))
+                st.rerun()
         except Exception as e:
             st.error(f"Error: {str(e)}")
     elif submit:
@@ -0,0 +1,142 @@
+import json
+import mmap
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Iterable, Iterator, Union
+
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+BLOB_FILE = "chunks.bin"
+TABLE_FILE = "chunks.sqlite"
+
+
+# 不依赖 pickle 的片段存储：所有片段文本拼接为一个 UTF-8 文件（内存映射读取），
+# 位置、ID、偏移量和元数据存放在 SQLite 表中，打开时不需要读入全部内容
+class ChunkStore(Docstore):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(os.path.join(path, BLOB_FILE), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # 空文件无法内存映射
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._conn = sqlite3.connect(
+            f"file:{os.path.join(path, TABLE_FILE)}?mode=ro",
+            uri=True,
+            check_same_thread=False
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    @staticmethod
+    def write(path: str, documents: Iterable[Document]):
+        """按位置顺序写入片段，documents[i] 对应向量索引中的第 i 个向量"""
+        writer = ChunkWriter(path)
+        writer.add(documents)
+        writer.close()
+
+    def _document(self, row) -> Document:
+        doc_id, offset, length, metadata = row
+        text = self._blob[offset:offset + length].decode("utf-8")
+        return Document(id=doc_id, page_content=text, metadata=json.loads(metadata))
+
+    def search(self, search: str) -> Union[str, Document]:
+        """按片段 ID 查找（LangChain Docstore 接口）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, offset, length, metadata FROM chunks WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return self._document(row)
+
+    def id_at(self, position: int) -> str:
+        """向量索引中第 position 个向量对应的片段 ID"""
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM chunks WHERE position = ?", (position,)).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def position_of(self, doc_id: str) -> int:
+        """片段在向量索引中的位置"""
+        with self._lock:
+            row = self._conn.execute("SELECT position FROM chunks WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            raise KeyError(doc_id)
+        return row[0]
+
+    def documents(self) -> Iterator[Document]:
+        """按位置顺序遍历所有片段"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, offset, length, metadata FROM chunks ORDER BY position").fetchall()
+        for row in rows:
+            yield self._document(row)
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            if isinstance(self._blob, mmap.mmap):
+                self._blob.close()
+            self._file.close()
+
+
+# 按位置顺序分批追加片段（构建时每批向量化后立即写入，不在内存中保留全部片段），close() 后才能用 ChunkStore 打开
+class ChunkWriter:
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.blob_path = os.path.join(path, BLOB_FILE)
+        self.table_path = os.path.join(path, TABLE_FILE)
+        if os.path.exists(self.table_path + ".tmp"):
+            os.remove(self.table_path + ".tmp")
+        self._file = open(self.blob_path + ".tmp", "wb")
+        self._conn = sqlite3.connect(self.table_path + ".tmp")
+        self._conn.execute("""
+            CREATE TABLE chunks (
+                position INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+        self.count = 0
+        self.offset = 0
+
+    def add(self, documents: Iterable[Document]):
+        rows = []
+        for doc in documents:
+            data = doc.page_content.encode("utf-8")
+            self._file.write(data)
+            rows.append((self.count, doc.id, self.offset, len(data), json.dumps(doc.metadata, ensure_ascii=False)))
+            self.count += 1
+            self.offset += len(data)
+        self._conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+        self._conn.commit()
+
+    def close(self):
+        """写完后替换为正式文件"""
+        self._file.close()
+        self._conn.close()
+        os.replace(self.blob_path + ".tmp", self.blob_path)
+        os.replace(self.table_path + ".tmp", self.table_path)
+
+
+# 位置 -> 片段 ID 的只读映射，按需查询 SQLite，替代 LangChain FAISS 中常驻内存的 index_to_docstore_id 字典
+class PositionIdMap(Mapping):
+    def __init__(self, store: ChunkStore):
+        self.store = store
+
+    def __getitem__(self, position: int) -> str:
+        return self.store.id_at(position)
+
+    def __iter__(self):
+        return iter(range(len(self.store)))
+
+    def __len__(self):
+        return len(self.store)
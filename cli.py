@@ -0,0 +1,208 @@
+"""
+知识库命令行工具
+
+不启动 Streamlit 构建、更新、校验和查看向量存储，使用与 Web 界面相同的加载、分割和向量化流程，
+可以在定时任务或构建容器中预先构建 vector_store/，再分发到只负责问答的服务节点。
+在项目根目录运行，成功时退出码为 0，失败或校验不通过时为 1。
+
+用法：
+    python cli.py build                       # 全量构建
+    python cli.py -v build --index-type hnsw  # 指定索引类型并输出逐个文件的信息
+    python cli.py update                      # 增量更新
+    python cli.py verify                      # 校验索引与清单、文档是否一致
+    python cli.py inspect --json              # 查看分区、向量数和磁盘占用
+    python cli.py --base-url http://127.0.0.1:11500 build  # 使用其他 Ollama 服务（如 ollama_stub.py）
+    python cli.py --metrics build.prom build  # 结束后把各阶段耗时写入 Prometheus 文本格式文件
+    python cli.py --embedding-model nomic-embed-text migrate  # 把当前版本重新向量化到新的向量模型
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from knowledge_base import ChatbotWithRetrieval
+from reporter import ConsoleReporter
+from vector_index import INDEX_TYPES, ENCODINGS, REDUCE_METHODS
+
+
+def create_bot(args, reporter):
+    bot = ChatbotWithRetrieval(args.data, reporter, auto_load=False)
+    if args.index_type:
+        bot.index_type = args.index_type
+    for key in ("encoding", "reduce_dim", "reduce_method"):
+        if getattr(args, key, None) is not None:
+            bot.index_params[key] = getattr(args, key)
+    if args.embedding_model:
+        bot.embedding_model = args.embedding_model
+    if args.base_url:
+        bot.base_url = args.base_url.rstrip("/")
+        bot.llm_client.base_url = bot.base_url
+    return bot
+
+
+def load(bot, reporter, allow_model_mismatch=False):
+    """加载已有的向量存储，不存在、格式过期或向量模型不一致时返回 False"""
+    if not bot.load_existing_vectorstore(allow_model_mismatch):
+        reporter.error("没有可用的向量存储，请先运行 python cli.py build")
+        return False
+    return True
+
+
+def check_model(bot, reporter):
+    """当前版本的向量模型与配置的不一致时返回 False：否则加载失败后会静默退化为用新模型全量重新向量化"""
+    if not bot.snapshots.current_path():
+        return True
+    model = bot.snapshot_embedding_model()
+    if model != bot.embedding_model:
+        reporter.error(
+            f"当前版本使用向量模型 {model}，与配置的 {bot.embedding_model} 不一致；"
+            f"请运行 python cli.py migrate 迁移到 {bot.embedding_model}，或运行 python cli.py build 全量重建"
+        )
+        return False
+    return True
+
+
+def write_metrics(bot, path):
+    """写入 Prometheus 文本格式，可放在 node_exporter 文本收集器目录中由定时任务刷新"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(bot.metrics.render_text())
+
+
+def build(bot, args, reporter):
+    if args.section:
+        # 只重建指定栏目的分片，其余分片沿用已有的向量存储
+        if not check_model(bot, reporter):
+            return False
+        bot.load_existing_vectorstore()
+        return bot.rebuild_sections(args.section)
+    return bot.rebuild()
+
+
+def update(bot, args, reporter):
+    # 没有可用的向量存储时 update_vectorstore 会执行全量构建
+    if not check_model(bot, reporter):
+        return False
+    bot.load_existing_vectorstore()
+    return bot.update_vectorstore()
+
+
+def verify(bot, args, reporter):
+    if not load(bot, reporter):
+        return False
+    problems = bot.verify_vectorstore()
+    for problem in problems:
+        reporter.error(problem)
+    if not problems:
+        reporter.success(f"校验通过：{len(bot.kb.manifest)} 个文件，{len(bot.kb.partitions)} 个分片")
+    return not problems
+
+
+def inspect(bot, args, reporter):
+    # 向量模型与配置不一致时也可以查看
+    if not load(bot, reporter, allow_model_mismatch=True):
+        return False
+    info = bot.describe()
+    if args.json:
+        print(json.dumps(info, ensure_ascii=False, indent=2))
+        return True
+    print(f"向量存储：{info['vector_store']}")
+    print(f"快照版本：{info['snapshot']}（共保留 {len(info['snapshots'])} 个）")
+    print(f"知识库版本：{info['kb_version']}")
+    print(f"向量模型：{info['embedding_model']}（配置为 {bot.embedding_model}）")
+    print(f"构建参数：{json.dumps(info['index_info'], ensure_ascii=False)}")
+    print(f"文件数：{info['files']}")
+    print("分片\t索引类型\t向量编码\t向量数\t维度\t词法条目\t磁盘占用(MB)")
+    for name, partition in sorted(info["partitions"].items()):
+        print("\t".join([
+            name,
+            partition["index_type"],
+            partition["encoding"],
+            str(partition["vectors"]),
+            str(partition["dim"]),
+            str(partition["lexical_docs"]),
+            f"{partition['disk_bytes'] / 1024 / 1024:.2f}"
+        ]))
+    return True
+
+
+def migrate(bot, args, reporter):
+    # 按构建时的向量模型加载当前版本，重新向量化后发布为新版本；运行中的 Web 服务使用相同的 EMBEDDING_MODEL 重启后切换
+    if not load(bot, reporter, allow_model_mismatch=True):
+        return False
+    return bot.migrate_embeddings()
+
+
+def snapshots(bot, args, reporter):
+    store = bot.snapshots
+    current = store.current_version()
+    versions = store.versions()
+    if not versions:
+        reporter.warning("还没有发布过快照版本")
+    for version in versions:
+        published = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(os.path.getmtime(store.path(version))))
+        print(f"{'*' if version == current else ' '} {version}  {published}")
+    return True
+
+
+def rollback(bot, args, reporter):
+    # 切换 CURRENT 指针，运行中的 Web 服务会在 reload_interval 秒内切换到该版本
+    return bot.rollback(args.version)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建、更新、校验和查看知识库向量存储")
+    parser.add_argument("--data", default="assets", help="文档目录")
+    parser.add_argument("--base-url", help="Ollama 服务地址，默认读取环境变量 OLLAMA_BASE_URL，未设置时为 http://127.0.0.1:11434")
+    parser.add_argument("--embedding-model", help="向量模型，默认读取环境变量 EMBEDDING_MODEL，未设置时为 llama2")
+    parser.add_argument("--metrics", help="结束后把各阶段耗时和计数写入该文件（Prometheus 文本格式）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出逐个文件的详细信息")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="全量构建向量存储")
+    build_parser.add_argument("--index-type", choices=INDEX_TYPES, help="向量索引类型，默认沿用当前版本的类型（没有时为 flat）")
+    build_parser.add_argument("--section", action="append", help="只重建该栏目的分片（如 guide、option），可重复指定")
+    build_parser.add_argument("--encoding", choices=ENCODINGS, help="向量存储精度，默认沿用当前版本的设置（没有时为 float32）")
+    build_parser.add_argument("--reduce-dim", type=int, help="构建时把向量降到该维度，0 表示不降维，默认沿用当前版本的设置")
+    build_parser.add_argument("--reduce-method", choices=REDUCE_METHODS, help="降维方式，默认沿用当前版本的设置（没有时为 pca）")
+    build_parser.set_defaults(handler=build)
+
+    update_parser = subparsers.add_parser("update", help="增量更新向量存储")
+    update_parser.set_defaults(handler=update, index_type=None)
+
+    verify_parser = subparsers.add_parser("verify", help="校验向量存储")
+    verify_parser.set_defaults(handler=verify, index_type=None)
+
+    inspect_parser = subparsers.add_parser("inspect", help="查看向量存储概况")
+    inspect_parser.add_argument("--json", action="store_true", help="以 JSON 格式输出")
+    inspect_parser.set_defaults(handler=inspect, index_type=None)
+
+    migrate_parser = subparsers.add_parser("migrate", help="用 --embedding-model 指定的向量模型重新向量化当前版本并发布")
+    migrate_parser.set_defaults(handler=migrate, index_type=None)
+
+    snapshots_parser = subparsers.add_parser("snapshots", help="列出已保存的快照版本（* 为当前版本）")
+    snapshots_parser.set_defaults(handler=snapshots, index_type=None)
+
+    rollback_parser = subparsers.add_parser("rollback", help="回滚到指定的快照版本，默认为上一个版本")
+    rollback_parser.add_argument("version", nargs="?", help="版本名，见 snapshots 命令")
+    rollback_parser.set_defaults(handler=rollback, index_type=None)
+
+    args = parser.parse_args()
+    reporter = ConsoleReporter(verbose=args.verbose)
+    bot = create_bot(args, reporter)
+    try:
+        ok = args.handler(bot, args, reporter)
+    except KeyboardInterrupt:
+        reporter.error("已中断")
+        sys.exit(130)
+    except Exception as e:
+        reporter.error(str(e))
+        sys.exit(1)
+    finally:
+        if args.metrics:
+            write_metrics(bot, args.metrics)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from conversation import estimate_tokens, truncate_tokens
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """按行归一化为单位向量，零向量保持为零"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def score_gap_cutoff(scores: np.ndarray, gap: float, min_keep: int = 1) -> np.ndarray:
+    """按得分断崖截断：从高到低排列后，在第一个相邻差值超过 gap 的位置截断，返回保留的布尔掩码"""
+    scores = np.asarray(scores, dtype=np.float32)
+    if len(scores) <= min_keep:
+        return np.ones(len(scores), dtype=bool)
+    ordered = np.sort(scores)[::-1]
+    drops = np.flatnonzero(ordered[:-1] - ordered[1:] > gap)
+    drops = drops[drops + 1 >= min_keep]
+    if not len(drops):
+        return np.ones(len(scores), dtype=bool)
+    return scores >= ordered[drops[0]]
+
+
+def mmr_select(
+    relevance: np.ndarray,
+    vectors: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.7,
+    duplicate_threshold: float = 0.95,
+    first: int = 0
+) -> List[int]:
+    """最大边际相关性（MMR）：依次选出与问题相关、又与已选片段不重复的候选，返回候选下标
+
+    relevance 为候选与问题的余弦相似度，vectors 为归一化的候选向量；从 first 开始选（调用方传入融合排序的第一名），
+    与已选片段的相似度达到 duplicate_threshold 的候选（如中英文的同一篇文档）直接排除
+    """
+    count = len(relevance)
+    if count == 0 or k <= 0:
+        return []
+    similarity = vectors @ vectors.T
+    selected = [first]
+    max_similarity = similarity[first].copy()  # 每个候选与已选片段的最大相似度
+    available = max_similarity < duplicate_threshold
+    available[first] = False
+    while len(selected) < k and available.any():
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+        available &= max_similarity < duplicate_threshold
+        available[best] = False
+    return selected
+
+
+def pack_by_tokens(texts: List[str], budget: int) -> Tuple[List[Tuple[int, str]], int]:
+    """按顺序把片段装入 token 预算，装不下的跳过并继续尝试后面较短的片段；
+    第一个片段超出预算时截断后装入，返回 ([(下标, 文本)], 使用的 token 数)"""
+    packed, used = [], 0
+    for index, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if used + tokens <= budget:
+            packed.append((index, text))
+            used += tokens
+        elif not packed:
+            text = truncate_tokens(text, budget)
+            packed.append((index, text))
+            used += estimate_tokens(text)
+    return packed, used
@@ -0,0 +1,83 @@
+import math
+import re
+from collections import deque
+
+CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af"
+CJK_PATTERN = re.compile(f"[{CJK_RANGES}]")
+# 英文单词、数字，以及除空白和中日韩字符以外的单个符号
+WORD_PATTERN = re.compile(f"[A-Za-z0-9_]+|[^\\sA-Za-z0-9_{CJK_RANGES}]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：每个中日韩字符约 1 个，英文单词和标点约 4/3 个"""
+    cjk = len(CJK_PATTERN.findall(text))
+    words = len(WORD_PATTERN.findall(text))
+    return cjk + math.ceil(words * 4 / 3)
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    """按估计的 token 数截断文本"""
+    tokens = estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    return text[:max(1, len(text) * budget // tokens)].rstrip() + "…"
+
+
+# 单个会话的对话记忆：保留最近几轮原文，更早的轮次压缩成滚动摘要，两部分都有 token 上限，
+# 提示词长度不随对话变长而增长
+class ConversationMemory:
+    def __init__(self, max_turns: int = 3, turn_budget: int = 800, summary_budget: int = 200, summary_answer_tokens: int = 40):
+        self.max_turns = max_turns  # 保留原文的最近轮数
+        self.turn_budget = turn_budget  # 最近几轮原文的 token 上限
+        self.summary_budget = summary_budget  # 滚动摘要的 token 上限，超出时丢弃最早的内容
+        self.summary_answer_tokens = summary_answer_tokens  # 压缩进摘要时每个回答保留的 token 数
+        self.turns = deque()  # [(问题, 回答)]
+        self.summary = deque()  # 已压缩的更早轮次，每轮一行
+
+    def __bool__(self):
+        return bool(self.turns or self.summary)
+
+    def add(self, question: str, answer: str):
+        """记录一轮完整的问答，超出轮数或 token 上限时把最早的轮次压缩进摘要"""
+        self.turns.append((question, answer))
+        while len(self.turns) > self.max_turns or self._turn_tokens() > self.turn_budget:
+            if len(self.turns) == 1:
+                # 只剩一轮仍然超出时截断回答
+                question, answer = self.turns[0]
+                self.turns[0] = (question, truncate_tokens(answer, max(1, self.turn_budget - estimate_tokens(question))))
+                break
+            self._compress(*self.turns.popleft())
+
+    def clear(self):
+        self.turns.clear()
+        self.summary.clear()
+
+    def retrieval_query(self, question: str) -> str:
+        """检索用的独立问题：把上一轮的问题拼在追问前面（如 "怎么设置折线图图例" + "那柱状图呢？"），
+        不额外调用模型，检索时既有上文的主题也有本轮的新内容"""
+        if not self.turns:
+            return question
+        return f"{self.turns[-1][0]} {question}"
+
+    def history(self) -> str:
+        """写入提示词的对话历史：滚动摘要 + 最近几轮原文"""
+        lines = []
+        if self.summary:
+            lines.append("Earlier conversation (summary):")
+            lines.extend(self.summary)
+        for question, answer in self.turns:
+            lines.append(f"User: {question}")
+            lines.append(f"Assistant: {answer}")
+        return "\n".join(lines)
+
+    def tokens(self) -> int:
+        return estimate_tokens(self.history())
+
+    def _turn_tokens(self) -> int:
+        return sum(estimate_tokens(question) + estimate_tokens(answer) for question, answer in self.turns)
+
+    def _compress(self, question: str, answer: str):
+        line = f"- {question} → {truncate_tokens(' '.join(answer.split()), self.summary_answer_tokens)}"
+        self.summary.append(truncate_tokens(line, self.summary_budget))
+        while len(self.summary) > 1 and sum(estimate_tokens(line) for line in self.summary) > self.summary_budget:
+            self.summary.popleft()
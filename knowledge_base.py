@@ -0,0 +1,1446 @@
+import os
+import json
+import uuid
+import hashlib
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from langchain_community.document_loaders import TextLoader
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from ollama_client import OllamaClient, OllamaBatchEmbeddings, DEFAULT_BASE_URL, COLD_LOAD_SECONDS, probe_ollama
+from answer_cache import SemanticAnswerCache
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from vector_index import IndexBuilder, build_config, configure_search, supports_incremental, index_type_of, index_encoding_of, read_index, write_index
+from pipeline import ordered_map, batched
+from markdown_splitter import MarkdownSplitter
+from chunk_store import ChunkStore, ChunkWriter, PositionIdMap
+from snapshot_store import SnapshotStore
+from reporter import Reporter
+from metrics import Metrics
+from scheduler import Scheduler, INTERACTIVE, LANES
+from warmup import ModelWarmer
+from conversation import estimate_tokens
+from context_selection import normalize, score_gap_cutoff, mmr_select, pack_by_tokens
+
+# 问答提示词（与 LangChain "stuff" 问答链的默认提示词一致）
+QA_PROMPT = """Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+# 多轮对话的问答提示词：在检索片段之后加入对话历史（滚动摘要 + 最近几轮）
+CONVERSATION_PROMPT = """Use the following pieces of context and the conversation so far to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Conversation so far:
+{history}
+
+Question: {question}
+Helpful Answer:"""
+
+# 自定义文本加载器，适配文件编码问题
+class CustomTextLoader(TextLoader):
+    def __init__(self, file_path: str, encoding: str = "utf-8"):
+        super().__init__(file_path, encoding=encoding)
+
+    def load(self):
+        try:
+            return super().load()
+        except UnicodeDecodeError:
+            return super().__init__(self.file_path, encoding="gbk").load()
+
+def check_ollama_service(reporter: Reporter = None, base_url: str = None):
+    """检查 Ollama 服务是否可用（并发探测各地址，结果短时间缓存并在会话间共享）"""
+    reporter = reporter or Reporter()
+    reporter.write("正在检查 Ollama 服务...")
+    status = probe_ollama(base_url)
+    for endpoint, error in status.errors.items():
+        reporter.write(f"连接 {endpoint} 失败: {error}")
+    if status.ok:
+        reporter.success(f"成功连接到 {status.endpoint}")
+    else:
+        reporter.error("所有连接尝试均失败")
+    return status.ok
+
+def check_models_available(model_names, reporter: Reporter = None, base_url: str = None):
+    """检查多个模型是否都已下载（同一次 /api/tags 探测结果，不触发模型加载），返回未找到的模型"""
+    reporter = reporter or Reporter()
+    reporter.write("正在检查模型状态...")
+    status = probe_ollama(base_url)
+    if not status.ok:
+        reporter.warning("无法连接 Ollama 服务，无法检查模型")
+        return list(model_names)
+    missing = []
+    for model_name in model_names:
+        if status.has_model(model_name):
+            reporter.success(f"模型 {model_name} 可用")
+        else:
+            missing.append(model_name)
+    if missing:
+        reporter.warning(f"模型 {', '.join(missing)} 未找到，已下载的模型：{', '.join(status.models) or '无'}")
+    return missing
+
+def check_model_available(model_name="llama2", reporter: Reporter = None, base_url: str = None):
+    """检查模型是否已下载"""
+    return not check_models_available([model_name], reporter, base_url)
+
+def shard_name(section, language):
+    """索引分片名：栏目.语言，如 guide.zh、demos.common"""
+    return f"{section}.{language}"
+
+def shard_section(name):
+    """分片所属栏目"""
+    return name.rsplit(".", 1)[0]
+
+def shard_language(name):
+    return name.rsplit(".", 1)[-1]
+
+def read_menu_titles(menu_path):
+    """读取栏目的 menu.json，返回 菜单路径（即语言目录下去掉 .md 的相对路径，如 tutorial_docs/Basic/How_to_Get_VChart）-> {语言: 标题}"""
+    with open(menu_path, "r", encoding="utf-8") as f:
+        menu = json.load(f)
+    titles = {}
+    def walk(children, prefix):
+        for child in children:
+            path = prefix + [child["path"]]
+            titles["/".join(path)] = child.get("title") or {}
+            walk(child.get("children", []), path)
+    walk(menu.get("children", []), [])
+    return titles
+
+LEXICAL_INDEX_FILE = "lexical_index.sqlite"
+
+# 单个索引分片（一个栏目的一种语言）：向量索引和词法索引使用相同的片段 ID
+class IndexPartition:
+    def __init__(self, vectorstore, lexical_index, path=None):
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.path = path  # 分片文件所在目录（快照或构建工作目录），读入内存修改、尚未保存的分片为 None
+        self.positions = None  # 片段 ID -> 向量位置，内存中的分片首次查找时建立
+
+    def position_of(self, doc_id):
+        """片段在向量索引中的位置，用于取回片段向量"""
+        docstore = self.vectorstore.docstore
+        if isinstance(docstore, ChunkStore):
+            return docstore.position_of(doc_id)
+        if self.positions is None:
+            self.positions = {value: position for position, value in self.vectorstore.index_to_docstore_id.items()}
+        return self.positions[doc_id]
+
+def open_partition(path, embeddings, index_params):
+    """只读打开分片目录：FAISS 索引以内存映射方式打开，片段文本和词法倒排表查询时按需从磁盘读取"""
+    index = read_index(os.path.join(path, "index.faiss"), mmap=True)
+    configure_search(index, index_params)
+    chunk_store = ChunkStore(path)
+    vectorstore = FAISS(embeddings, index, chunk_store, PositionIdMap(chunk_store))
+    return IndexPartition(vectorstore, LexicalIndex.open(os.path.join(path, LEXICAL_INDEX_FILE)), path)
+
+# 分批构建一个索引分片：每批片段的正文和词法倒排表立即写入 path 目录，内存中只有向量索引，finish() 后只读打开
+class PartitionBuilder:
+    def __init__(self, embeddings, index_type, index_params, path):
+        self.embeddings = embeddings
+        self.index_params = index_params
+        self.path = path
+        self.index_builder = IndexBuilder(index_type, index_params)
+        self.chunks = ChunkWriter(path)
+        self.lexical_index = LexicalIndex(path=os.path.join(path, LEXICAL_INDEX_FILE))
+
+    def add(self, splits, vectors):
+        self.index_builder.add(np.array(vectors, dtype=np.float32))
+        self.chunks.add(splits)
+        self.lexical_index.add_many((split.id, split.page_content) for split in splits)
+
+    def finish(self):
+        write_index(self.index_builder.finish(), os.path.join(self.path, "index.faiss"))
+        self.chunks.close()
+        self.lexical_index.close()
+        return open_partition(self.path, self.embeddings, self.index_params)
+
+# 一个完整的知识库版本：按栏目和语言划分的索引分片和文件清单，构建完成后整体替换
+class KnowledgeBase:
+    def __init__(self, partitions, manifest, path=None, version=None, embeddings=None, index_info=None, workspace=None):
+        self.partitions = partitions  # 分片名 -> IndexPartition
+        self.manifest = manifest  # 文件路径 -> {size, mtime, sha256, language, shard, chunk_ids}
+        self.path = path  # 所在的快照目录，尚未保存时为 None
+        self.version = version  # 快照版本名
+        self.embeddings = embeddings  # 构建该版本使用的向量模型，查询时用它向量化问题，与索引一起替换
+        self.index_info = index_info or {}  # 构建参数（index_type、index_params、splitter），保存为 index_info.json
+        self.workspace = workspace  # 新建分片所在的构建工作目录，保存为快照版本后删除
+
+    @property
+    def dim(self):
+        """向量维度（各分片相同）"""
+        return next(iter(self.partitions.values())).vectorstore.index.d if self.partitions else None
+
+# 已保存的向量存储与配置的向量模型或维度不一致：不同模型的向量不可比较，不能直接加载查询
+class EmbeddingModelMismatch(Exception):
+    def __init__(self, message, model, dim):
+        super().__init__(message)
+        self.model = model  # 构建该版本使用的向量模型
+        self.dim = dim
+
+# 用于处理文档加载、文本分割和向量存储
+class ChatbotWithRetrieval:
+    def __init__(self, data_folder: str, reporter: Reporter = None, auto_load: bool = True):
+        self.data_folder = data_folder
+        # 进度和提示信息的默认输出位置（命令行）；Web 界面各会话用 reporting() 临时指定，后台线程不输出
+        self.default_reporter = reporter or Reporter()
+        self._local = threading.local()
+        self.kb = None  # 当前使用的知识库版本
+        self.embeddings = None
+        self.base_url = os.environ.get("OLLAMA_BASE_URL", DEFAULT_BASE_URL).rstrip("/")  # Ollama 服务地址
+        self.llm_model = "llama2"  # 生成模型
+        # 向量模型，与生成模型分开配置，默认读取环境变量 EMBEDDING_MODEL；记录在 index_info.json 中，
+        # 与已保存的向量存储不一致时拒绝加载，需要重新构建或迁移（migrate_embeddings）
+        self.embedding_model = os.environ.get("EMBEDDING_MODEL", "llama2")
+        # 向量模型与已保存的不一致时，先用原模型继续提供查询，同时在后台迁移到新模型（环境变量 EMBEDDING_MIGRATE=1）
+        self.migrate_on_mismatch = os.environ.get("EMBEDDING_MIGRATE", "0") == "1"
+        self.migration = None  # 正在进行或最近一次的向量模型迁移：{model, done, total, error}
+        self.migration_thread = None
+        # 模型空闲后在 Ollama 中保留的时长，默认读取与 Ollama 服务端同名的环境变量 OLLAMA_KEEP_ALIVE
+        self.keep_alive = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+        self.keep_warm_interval = 0  # 工作时间内定期保活的间隔（秒），0 表示只在启动时预热
+        self.keep_warm_hours = (9, 18)  # 定期保活的小时段（周一至周五）
+        self.warmer = None
+        self.llm_client = OllamaClient(self.base_url, keep_alive=self.keep_alive)  # 流式生成客户端
+        self.retrieval_k = 4  # 写入提示词的最多片段数，实际数量由得分断崖和 token 预算决定
+        self.hybrid_fetch_k = 10  # 向量检索和 BM25 检索各取的候选数
+        self.candidate_k = 12  # 融合后参与去冗余和截断的候选数
+        self.mmr_lambda = 0.7  # MMR 中相关性的权重，越小越偏向多样性
+        self.duplicate_threshold = 0.95  # 与已选片段的余弦相似度达到该值视为重复（如中英文的同一篇文档）
+        self.score_gap = 0.1  # 候选与问题的余弦相似度按从高到低排列，相邻差值超过该值处截断
+        self.context_token_budget = 1024  # 检索片段在提示词中的 token 预算
+        self.cross_language_threshold = 0.5  # 本语言分片最佳结果的余弦相似度低于该值时，同时检索其他语言的分片（None 表示关闭）
+        self.sections = None  # 参与索引的栏目（数据目录的一级子目录），None 表示全部
+        self.menu_titles = {}  # 栏目 -> read_menu_titles() 的结果，扫描文件时刷新
+        self.search_workers = 4  # 并行检索分片的线程数
+        self.search_pool = ThreadPoolExecutor(max_workers=self.search_workers, thread_name_prefix="shard-search")
+        self.answer_cache = SemanticAnswerCache(
+            "answer_cache.sqlite",
+            threshold=0.95,  # 问题向量余弦相似度达到该值即视为同一问题
+            max_entries=1000,
+            ttl=7 * 24 * 3600
+        )
+        self.lock = threading.Lock()  # 保证重建/更新串行执行，查询不加锁
+        self.vector_store_path = "vector_store"  # 向量存储保存路径，每个版本保存在 snapshots/<版本>/ 下
+        self.snapshot_keep = 3  # 保留的快照版本数，用于回滚
+        self.reload_interval = 5  # Web 服务检查是否有新发布版本的间隔（秒），0 表示不检查
+        self.reload_thread = None
+        self.embedding_cache_path = "embedding_cache.sqlite"  # 向量缓存路径，不随重建删除
+        self.embedding_batch_size = 16  # 分给一个向量化线程的片段数（每个片段仍是一个 Ollama 请求），也是失败重试的单位
+        self.embedding_workers = 4  # 并发向量化线程数
+        self.load_workers = 4  # 并发读取和分割文件的线程数
+        self.pipeline_batch_size = 256  # 构建时每次送去向量化的片段数，决定流水线在途数据量
+        self.splitter = "markdown"  # 分块方式，记录在 index_info.json 中，变化后需重新初始化
+        # 向量索引类型：flat（精确）/ ivf / hnsw / pq；None 表示沿用当前版本记录的类型（没有时为 flat），
+        # 与记录的不同时增量更新和单栏目重建改为全量重建，保证各分片的索引结构一致
+        self.index_type = None
+        # 覆盖 vector_index.DEFAULT_INDEX_PARAMS 中的调优参数，如 {"nprobe": 32}，未指定的沿用当前版本记录的参数；
+        # 向量压缩：{"encoding": "int8"}（或 float16）标量量化，{"reduce_dim": 1024, "reduce_method": "pca"} 构建时降维
+        self.index_params = {}
+        # 查询和构建各阶段的耗时统计，环境变量 METRICS_ENABLED=0 时关闭
+        self.metrics = Metrics(enabled=os.environ.get("METRICS_ENABLED", "1") != "0")
+        self.metrics.gauge("answer_cache_hit_rate", lambda: self.answer_cache.hit_rate)
+        self.metrics.gauge("answer_cache_saved_seconds", lambda: self.answer_cache.saved_seconds)
+        self.metrics.gauge("embedding_cache_hit_rate", self.embedding_cache_hit_rate)
+        self.metrics.gauge("indexed_files", lambda: len(self.kb.manifest) if self.kb else 0)
+        # 所有会话和后台构建共用的 Ollama 请求调度，并发数默认与 Ollama 的 OLLAMA_NUM_PARALLEL 一致
+        self.scheduler = Scheduler(max_concurrency=int(os.environ.get("OLLAMA_NUM_PARALLEL") or 4))
+        self.queue_timeout = 120  # 提问排队的最长时间（秒），超过后提示稍后重试
+        for lane in LANES:
+            self.metrics.gauge(f"scheduler_{lane}_active", lambda lane=lane: self.scheduler.stats()["active"][lane])
+            self.metrics.gauge(f"scheduler_{lane}_queued", lambda lane=lane: self.scheduler.stats()["queued"][lane])
+        self.metrics.gauge("scheduler_timeouts", lambda: self.scheduler.timeouts)
+        self.metrics.gauge("scheduler_cancelled", lambda: self.scheduler.cancelled)
+        
+        # 尝试加载现有的向量存储（auto_load=False 时由调用方决定加载或构建）
+        if auto_load:
+            self.start()
+
+    @property
+    def reporter(self):
+        """当前线程的消息输出位置"""
+        return getattr(self._local, "reporter", None) or self.default_reporter
+
+    @contextmanager
+    def reporting(self, reporter):
+        """在当前线程内把消息输出到 reporter（如发起构建的浏览器会话），结束后恢复；其他会话和后台线程不受影响"""
+        previous = getattr(self._local, "reporter", None)
+        self._local.reporter = reporter
+        try:
+            yield reporter
+        finally:
+            self._local.reporter = previous
+
+    def start(self):
+        """以服务方式启动：加载现有的向量存储，没有可用的版本时构建"""
+        # 先在后台预热模型，与加载索引同时进行
+        self.start_warmup()
+        if self.load_existing_vectorstore():
+            self.reporter.success("已加载现有向量存储")
+            if self.kb.embeddings.model != self.embedding_model:
+                self.start_migration()
+        else:
+            self.initialize_bot()
+        # 其他进程（如 cli.py build）发布新版本或回滚后自动切换
+        self.start_reload_watcher()
+
+    @property
+    def snapshots(self):
+        return SnapshotStore(self.vector_store_path, keep=self.snapshot_keep)
+
+    def load_existing_vectorstore(self, allow_model_mismatch=None):
+        """尝试加载现有的向量存储（CURRENT 指针指向的版本）
+
+        向量模型与配置的不一致时拒绝加载；allow_model_mismatch=True（默认取 migrate_on_mismatch）时改用构建该版本的模型加载，
+        用于迁移期间继续提供查询
+        """
+        if allow_model_mismatch is None:
+            allow_model_mismatch = self.migrate_on_mismatch
+        try:
+            if self.snapshots.current_path():
+                # 配置 embeddings
+                self.embeddings = self.create_embeddings(self.base_url)
+                
+                with self.metrics.span("index.open"):
+                    try:
+                        kb = self.read_knowledge_base()
+                    except EmbeddingModelMismatch as e:
+                        if not allow_model_mismatch:
+                            raise
+                        self.reporter.warning(f"{str(e)}，迁移完成前继续使用 {e.model}")
+                        kb = self.read_knowledge_base(embedding_model=e.model)
+                self.swap(kb)
+                return True
+            return False
+        except Exception as e:
+            self.reporter.warning(f"加载现有向量存储失败：{str(e)}")
+            return False
+
+    def read_knowledge_base(self, writable=False, version=None, reporter=None, embedding_model=None):
+        """从磁盘读取一份完整的知识库，默认读取当前版本，每个分片保存在 snapshots/<版本>/<栏目>.<语言>/ 下
+        
+        writable=False 时以只读内存映射方式打开，用于查询；writable=True 时完整读入内存，用于增量更新。
+        该版本的向量模型或维度与 embedding_model（默认为配置的向量模型）不一致时抛出 EmbeddingModelMismatch
+        """
+        reporter = reporter or self.reporter
+        embedding_model = embedding_model or self.embedding_model
+        store = self.snapshots
+        version = version or store.current_version()
+        if version is None:
+            raise Exception("还没有发布过向量存储版本")
+        path = store.path(version)
+        
+        index_info = self.load_index_info(path)
+        # 旧版本没有记录向量模型，当时固定使用 llama2
+        saved_model = index_info.get("embedding_model", "llama2")
+        saved_dim = index_info.get("embedding_dim")
+        if saved_model != embedding_model:
+            raise EmbeddingModelMismatch(
+                f"向量存储使用向量模型 {saved_model} 构建，与配置的 {embedding_model} 不一致，"
+                f"请重新初始化或运行 python cli.py --embedding-model {embedding_model} migrate",
+                saved_model, saved_dim
+            )
+        if embedding_model == self.embedding_model and self.embeddings is not None:
+            embeddings = self.embeddings
+        else:
+            embeddings = self.create_embeddings(self.base_url, embedding_model)
+        
+        search_params = dict(index_info.get("index_params", {}), **self.index_params)
+        partitions = {}
+        for name in sorted(os.listdir(path)):
+            partition_path = os.path.join(path, name)
+            if os.path.exists(os.path.join(partition_path, "index.faiss")):
+                partitions[name] = self.read_partition(partition_path, writable, embeddings, search_params)
+                dim = partitions[name].vectorstore.index.d
+                if saved_dim is not None and dim != saved_dim:
+                    raise EmbeddingModelMismatch(
+                        f"分片 {name} 的向量维度 {dim} 与记录的 {saved_dim} 维不一致，请重新初始化",
+                        saved_model, saved_dim
+                    )
+        if not partitions:
+            raise Exception("向量存储中没有索引分片，请重新初始化")
+        
+        if self.index_type and index_info.get("index_type", "flat") != self.index_type:
+            reporter.warning(f"已保存的索引类型为 {index_info.get('index_type', 'flat')}，与配置的 {self.index_type} 不一致，重新初始化后生效")
+        if index_info.get("splitter") != self.splitter:
+            reporter.warning("向量存储使用旧的分块方式构建，重新初始化后生效")
+        return KnowledgeBase(partitions, self.load_manifest(path), path, version, embeddings, index_info)
+
+    def read_partition(self, partition_path, writable=False, embeddings=None, index_params=None):
+        """读取单个分片（不使用 pickle，可以安全加载来源不明的向量存储），index_params 为查询参数（默认为 self.index_params）
+
+        writable=True 时把向量、片段和词法索引完整读入内存（增量更新时修改，保存时整体写出）
+        """
+        index_params = self.index_params if index_params is None else index_params
+        if not writable:
+            return open_partition(partition_path, embeddings or self.embeddings, index_params)
+        
+        index = read_index(os.path.join(partition_path, "index.faiss"), mmap=False)
+        configure_search(index, index_params)
+        chunk_store = ChunkStore(partition_path)
+        documents = list(chunk_store.documents())
+        chunk_store.close()
+        docstore = InMemoryDocstore({doc.id: doc for doc in documents})
+        index_to_docstore_id = {position: doc.id for position, doc in enumerate(documents)}
+        vectorstore = FAISS(embeddings or self.embeddings, index, docstore, index_to_docstore_id)
+        
+        return IndexPartition(vectorstore, LexicalIndex.load(os.path.join(partition_path, LEXICAL_INDEX_FILE)))
+
+    def swap(self, kb):
+        """用新索引替换当前索引，正在进行的查询继续使用旧索引直到完成"""
+        # 查询只读取 self.kb 引用，替换引用本身是原子的
+        self.kb = kb
+        # 知识库内容或向量模型变化后旧答案失效
+        self.answer_cache.set_kb_version(self.kb_version(kb.manifest, kb.embeddings))
+
+    def kb_version(self, manifest, embeddings=None):
+        """根据片段 ID 和向量模型计算知识库版本，每次重建、有文件变更或更换向量模型都会得到新版本"""
+        digest = hashlib.sha256()
+        model = getattr(embeddings, "model", None)
+        if model:
+            # 不同模型的问题向量不可比较，答案缓存随模型一起失效
+            digest.update(model.encode("utf-8"))
+        for path in sorted(manifest):
+            digest.update(path.encode("utf-8"))
+            digest.update(",".join(manifest[path]["chunk_ids"]).encode("utf-8"))
+        return digest.hexdigest()
+
+    def create_embeddings(self, base_url, model=None):
+        """创建带持久化缓存的 embeddings（默认使用配置的向量模型），文本未变化的片段重建时不再请求 Ollama"""
+        model = model or self.embedding_model
+        client = OllamaClient(base_url, pool_size=self.embedding_workers, keep_alive=self.keep_alive)
+        return CachedEmbeddings(
+            OllamaBatchEmbeddings(
+                client,
+                model=model,
+                batch_size=self.embedding_batch_size,
+                max_workers=self.embedding_workers,
+                progress_callback=self.report_embedding_progress,
+                scheduler=self.scheduler
+            ),
+            EmbeddingCache(self.embedding_cache_path),
+            model=model
+        )
+
+    def start_warmup(self):
+        """在后台预热向量模型和生成模型（Web 服务启动时调用），keep_warm_interval > 0 时在工作时间内定期保活"""
+        if self.warmer is not None:
+            return
+        models = [(self.llm_model, False)]
+        if self.embedding_model != self.llm_model:
+            models.insert(0, (self.embedding_model, True))
+        self.warmer = ModelWarmer(
+            OllamaClient(self.base_url, keep_alive=self.keep_alive),
+            models,
+            scheduler=self.scheduler,
+            metrics=self.metrics,
+            interval=self.keep_warm_interval,
+            hours=self.keep_warm_hours
+        ).start()
+
+    def embedding_cache_hit_rate(self):
+        """最近一次构建或更新中片段向量缓存的命中率"""
+        hits, misses = getattr(self.embeddings, "hits", 0), getattr(self.embeddings, "misses", 0)
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def report_embedding_progress(self, done, total, rate):
+        """显示向量化进度和吞吐量"""
+        self.reporter.progress("embedding", done, total, f"正在向量化 {done}/{total} 个片段，{rate:.1f} 片段/秒")
+
+    def save_vectorstore(self):
+        """把当前知识库保存为新的快照版本并原子发布，失败时返回 False（当前版本不受影响）
+
+        已在磁盘上的分片（上一版本中未变化的，或构建时写入工作目录的）以硬链接放入新版本，只写出在内存中修改过的分片；
+        发布后删除构建工作目录
+        """
+        if not self.kb:
+            return True
+        store = self.snapshots
+        staging = None
+        try:
+            start = time.perf_counter()
+            version, staging = store.stage()
+            for name, partition in self.kb.partitions.items():
+                self.save_partition(partition, os.path.join(staging, name))
+            self.save_manifest(staging)
+            self.save_index_info(staging)
+            path = store.publish(version, staging)
+            self.kb.path, self.kb.version = path, version
+            for name, partition in self.kb.partitions.items():
+                partition.path = os.path.join(path, name)
+            if self.kb.workspace:
+                store.discard(self.kb.workspace)
+                self.kb.workspace = None
+            self.metrics.observe_stage("index.save", time.perf_counter() - start)
+            self.reporter.success(f"向量存储已保存到本地（版本 {version}）")
+            return True
+        except Exception as e:
+            if staging:
+                store.discard(staging)
+            self.reporter.error(f"保存向量存储失败：{str(e)}")
+            return False
+
+    def save_partition(self, partition, partition_path):
+        """保存单个分片：FAISS 索引、片段文本（UTF-8 拼接文件 + SQLite 偏移表）和词法索引；已在磁盘上的分片直接硬链接"""
+        if partition.path and os.path.isdir(partition.path):
+            self.snapshots.link_tree(partition.path, partition_path)
+            return
+        os.makedirs(partition_path, exist_ok=True)
+        vectorstore = partition.vectorstore
+        write_index(vectorstore.index, os.path.join(partition_path, "index.faiss"))
+        ChunkStore.write(partition_path, self.partition_documents(partition))
+        partition.lexical_index.save(os.path.join(partition_path, LEXICAL_INDEX_FILE))
+
+    def initialize_bot(self):
+        """初始化机器人的所有组件，成功构建并保存后返回 True"""
+        try:
+            # 检查 Ollama 服务
+            if not check_ollama_service(self.reporter, self.base_url):
+                self.reporter.main.error("Ollama 服务未运行！")
+                self.reporter.main.info("""
+                ### 请按以下步骤操作：
+                1. 打开新的命令行窗口（以管理员身份运行）
+                2. 运行以下命令停止现有服务：
+                   ```
+                   taskkill /F /IM ollama.exe
+                   ```
+                3. 等待几秒后重新启动服务：
+                   ```
+                   ollama serve
+                   ```
+                4. 在新窗口中测试服务：
+                   ```
+                   curl {base_url}/
+                   ```
+                5. 如果测试成功，刷新此页面
+                
+                如果还是不行：
+                1. 检查任务管理器中是否有多个 ollama 进程
+                2. 检查端口 {port} 是否被占用，或通过环境变量 OLLAMA_BASE_URL 指定服务地址
+                3. 尝试重启电脑后重试
+                """.format(base_url=self.base_url, port=urlsplit(self.base_url).port or 11434))
+                return False
+            
+            # 向量模型和生成模型分开配置，两者都需要已下载（生成模型缺失时要到第一次提问才会失败）
+            missing = check_models_available(
+                list(dict.fromkeys([self.embedding_model, self.llm_model])), self.reporter, self.base_url
+            )
+            if missing:
+                self.reporter.main.error(f"{', '.join(missing)} 模型未找到！")
+                self.reporter.main.info("""
+                ### 请按以下步骤操作：
+                1. 确保 Ollama 服务正在运行
+                2. 在新的命令行窗口中运行：
+                   ```
+                   {pull}
+                   ```
+                3. 等待下载完成（保持窗口开着）
+                4. 下载完成后运行：
+                   ```
+                   ollama list
+                   ```
+                5. 确认看到 {models} 后刷新此页面
+                """.format(pull="\n                   ".join(f"ollama pull {model}" for model in missing), models="、".join(missing)))
+                return False
+
+            status = probe_ollama(self.base_url)
+            if self.base_url in status.errors:
+                # 配置的地址连接失败但其他回环写法可用（如 localhost 只解析到 IPv6），改用可用的地址
+                self.reporter.warning(f"{self.base_url} 不可用，改用 {status.endpoint}")
+                self.base_url = status.endpoint
+                self.llm_client.base_url = status.endpoint
+                self.embeddings = None
+
+            self.reporter.main.success("Ollama 服务正常运行")
+            self.reporter.main.info("正在初始化机器人...")
+            
+            # 配置 embeddings
+            if self.embeddings is None:
+                self.embeddings = self.create_embeddings(self.base_url)
+            
+            self.reporter.main.info("正在加载文档并创建向量存储...")
+            kb = self.build_knowledge_base(self.scan_files())
+            if not kb.manifest:
+                self.snapshots.discard(kb.workspace)
+                self.reporter.main.error("未找到任何文档！")
+                return False
+            self.reporter.main.success(f"已加载 {len(kb.manifest)} 个文档")
+            
+            # 构建完成后再替换，构建期间其他会话继续使用旧索引
+            self.swap(kb)
+            
+            # 保存为新的快照版本并发布
+            return self.save_vectorstore()
+            
+        except Exception as e:
+            self.reporter.main.error(f"初始化失败：{str(e)}")
+            self.reporter.main.info("""
+            ### 请尝试以下解决方案：
+            1. 检查 Ollama 服务状态
+            2. 确保网络连接正常
+            3. 重启应用
+            4. 查看详细错误信息
+            """)
+            raise e
+
+    def scan_files(self, sections=None):
+        """扫描数据目录下的各栏目（guide、api、option、examples、demos 等一级子目录），返回所有待索引的 .md 文件路径
+
+        sections 指定只扫描这些栏目，默认使用 self.sections（None 表示全部）；同时读取各栏目的 menu.json 菜单标题
+        """
+        sections = sections or self.sections
+        available = sorted(
+            name for name in os.listdir(self.data_folder)
+            if os.path.isdir(os.path.join(self.data_folder, name))
+        ) if os.path.isdir(self.data_folder) else []
+        if sections:
+            for section in sections:
+                if section not in available:
+                    self.reporter.warning(f"栏目不存在：{os.path.join(self.data_folder, section)}")
+            available = [section for section in available if section in sections]
+        
+        file_paths = []
+        menu_titles = {}
+        # 数据目录根部的文件（如项目自身的 README.md）不属于任何栏目，不参与索引
+        for section in available:
+            section_dir = os.path.join(self.data_folder, section)
+            menu_path = os.path.join(section_dir, "menu.json")
+            if os.path.exists(menu_path):
+                try:
+                    menu_titles[section] = read_menu_titles(menu_path)
+                except (OSError, ValueError, KeyError) as e:
+                    self.reporter.warning(f"读取菜单失败 {menu_path}：{str(e)}")
+            for root, dirs, files in os.walk(section_dir):
+                dirs.sort()
+                for file in sorted(files):
+                    if file.endswith(".md"):
+                        file_paths.append(os.path.join(root, file))
+        self.menu_titles = dict(self.menu_titles, **menu_titles)
+        
+        if not file_paths:
+            self.reporter.main.error("""
+            ### 未找到任何文档！
+            
+            请确保数据目录的栏目子目录（如 assets/guide/、assets/api/、assets/faq/）中包含 .md 文件
+            
+            当前搜索路径：{}
+            """.format([os.path.abspath(os.path.join(self.data_folder, section)) for section in sections or available] or os.path.abspath(self.data_folder)))
+            raise Exception("未找到任何支持的文档文件")
+        
+        return file_paths
+
+    def detect_language(self, file_path):
+        """根据路径中的 zh/en 目录判断文档语言，没有语言目录的归入 common"""
+        parts = os.path.normpath(file_path).split(os.sep)
+        for language in ("zh", "en"):
+            if language in parts:
+                return language
+        return "common"
+
+    def document_metadata(self, file_path):
+        """文件的元数据（写入该文件的每个片段）：栏目、语言、所在分片，以及栏目 menu.json 中的菜单标题（没有时为文件名）"""
+        parts = os.path.relpath(file_path, self.data_folder).split(os.sep)
+        section = parts[0] if len(parts) > 1 else "common"
+        language = self.detect_language(file_path)
+        menu_parts = parts[2:] if len(parts) > 2 and parts[1] == language else parts[1:]
+        titles = self.menu_titles.get(section, {}).get(os.path.splitext("/".join(menu_parts))[0], {})
+        return {
+            "section": section,
+            "language": language,
+            "shard": shard_name(section, language),
+            "menu_title": titles.get(language) or titles.get("en") or titles.get("zh")
+            or os.path.splitext(os.path.basename(file_path))[0]
+        }
+
+    def text_splitter(self):
+        """文本分割器，全量构建和增量更新使用相同的参数"""
+        return MarkdownSplitter(
+            chunk_size=1000,  # 片段正文目标长度，标题路径前缀另计
+            min_chunk_size=400,  # 过小的相邻小节合并，减少向量化次数和索引条目
+            max_block_size=2000  # 代码块和表格在该长度内保持完整
+        )
+
+    def build_knowledge_base(self, file_paths, index_info=None):
+        """流式构建知识库：读取和分割在线程池中进行，片段按批向量化后立即追加到对应分片
+
+        各阶段同时进行，总耗时接近最慢的阶段（通常是向量化）；在途的文件和片段数量有上限，每批片段的正文和词法倒排表
+        立即写入构建工作目录（见 PartitionBuilder），内存中只保留向量索引。index_info 为构建参数，默认为 build_index_info()
+        """
+        index_info = index_info or self.build_index_info()
+        workspace = self.snapshots.workspace()
+        try:
+            self.reporter.write("🔍 开始搜索文档...")
+            self.embeddings.hits = self.embeddings.misses = 0
+            builders = {}
+            manifest = {}
+            progress = {"files": 0, "chunks": 0}
+            start = time.time()
+
+            def iter_splits():
+                for file_path, docs, splits, fingerprint, error in ordered_map(
+                    self.load_and_split, file_paths, max_workers=self.load_workers
+                ):
+                    progress["files"] += 1
+                    if error is not None:
+                        self.reporter.error(f"加载失败 {os.path.basename(file_path)}：{error}")
+                        continue
+                    # 内容相同的文件（如中英文目录下的同一篇示例）各自索引：它们属于不同的分片，
+                    # 只索引其中一个会在该文件删除或修改后丢失内容；重复片段的向量来自向量缓存，不会重复请求 Ollama
+                    entry = self.manifest_entry(file_path, fingerprint)
+                    manifest[file_path] = entry
+                    for split in splits:
+                        split.id = str(uuid.uuid4())
+                        entry["chunk_ids"].append(split.id)
+                        yield split
+
+            for batch in batched(iter_splits(), self.pipeline_batch_size):
+                with self.metrics.span("build.embed"):
+                    vectors = self.embeddings.embed_documents([split.page_content for split in batch])
+                with self.metrics.span("build.index_add"):
+                    for name, group in self.group_by_shard(zip(batch, vectors)).items():
+                        if name not in builders:
+                            builders[name] = PartitionBuilder(
+                                self.embeddings, index_info["index_type"], index_info["index_params"], os.path.join(workspace, name)
+                            )
+                        builders[name].add([split for split, _ in group], [vector for _, vector in group])
+                progress["chunks"] += len(batch)
+                elapsed = time.time() - start
+                self.reporter.progress(
+                    "build",
+                    progress["files"],
+                    len(file_paths),
+                    f"已处理 {progress['files']}/{len(file_paths)} 个文件，已索引 {progress['chunks']} 个片段，"
+                    f"{progress['chunks'] / elapsed if elapsed > 0 else 0:.1f} 片段/秒"
+                )
+            self.reporter.end_progress("embedding")
+            self.reporter.end_progress("build")
+
+            with self.metrics.span("build.finish"):
+                partitions = {name: builder.finish() for name, builder in builders.items()}
+            self.metrics.observe_stage("build.total", time.time() - start)
+            self.metrics.incr("build.files", progress["files"])
+            self.metrics.incr("build.chunks", progress["chunks"])
+            self.reporter.success(f"共加载了 {len(manifest)} 个文档，分割为 {progress['chunks']} 个片段")
+            self.reporter.success("向量索引创建完成")
+            self.reporter.info(f"向量缓存命中 {self.embeddings.hits} 个，新向量化 {self.embeddings.misses} 个片段")
+            return KnowledgeBase(partitions, manifest, embeddings=self.embeddings, index_info=index_info, workspace=workspace)
+        except Exception as e:
+            self.snapshots.discard(workspace)
+            self.reporter.error(f"创建向量存储失败：{str(e)}")
+            raise e
+
+    def load_and_split(self, file_path):
+        """读取并分割单个文件（在工作线程中执行，不输出消息），返回 (路径, 文档, 片段, 指纹, 错误)"""
+        try:
+            with self.metrics.span("build.load"):
+                fingerprint = self.file_fingerprint(file_path)
+                docs = CustomTextLoader(file_path).load()
+            for doc in docs:
+                doc.metadata.update(self.document_metadata(file_path))
+            with self.metrics.span("build.split"):
+                splits = self.text_splitter().split_documents(docs)
+            return file_path, docs, splits, fingerprint, None
+        except Exception as e:
+            return file_path, None, None, None, str(e)
+
+    def group_by_shard(self, items):
+        """按分片分组，items 为片段或 (片段, 向量)"""
+        groups = {}
+        for item in items:
+            split = item[0] if isinstance(item, tuple) else item
+            groups.setdefault(split.metadata["shard"], []).append(item)
+        return groups
+
+    def manifest_entry(self, file_path, fingerprint):
+        """文件清单条目：指纹、语言和所在分片，chunk_ids 由调用方填写"""
+        metadata = self.document_metadata(file_path)
+        return dict(fingerprint, language=metadata["language"], shard=metadata["shard"], chunk_ids=[])
+
+    def create_partition(self, splits, index_info, path):
+        """用同一批片段按 index_info 记录的索引类型和参数在 path 目录下创建一个分片的向量索引和词法索引"""
+        builder = PartitionBuilder(self.embeddings, index_info["index_type"], index_info["index_params"], path)
+        builder.add(splits, self.embeddings.embed_documents([split.page_content for split in splits]))
+        return builder.finish()
+
+    def add_to_partition(self, partition, splits):
+        """向支持增量追加的分片加入新片段"""
+        partition.vectorstore.add_documents(splits, ids=[split.id for split in splits])
+        partition.lexical_index.add_many((split.id, split.page_content) for split in splits)
+
+    def file_fingerprint(self, file_path):
+        """计算文件指纹（大小、修改时间、内容哈希）"""
+        stat = os.stat(file_path)
+        with open(file_path, "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+
+    def load_manifest(self, path):
+        """读取快照目录中的文件清单"""
+        manifest_path = os.path.join(path, "manifest.json")
+        try:
+            if os.path.exists(manifest_path):
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception as e:
+            self.reporter.warning(f"读取文件清单失败：{str(e)}")
+        return {}
+
+    def save_manifest(self, path):
+        """保存文件清单（写临时文件后整体替换）"""
+        manifest_path = os.path.join(path, "manifest.json")
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.kb.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+    def load_index_info(self, path=None):
+        """读取索引构建参数，默认读取当前使用的版本"""
+        path = path or (self.kb.path if self.kb else None) or self.snapshots.current_path()
+        index_info_path = os.path.join(path, "index_info.json") if path else ""
+        if os.path.exists(index_info_path):
+            with open(index_info_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def save_index_info(self, path):
+        """保存当前知识库的构建参数和向量模型、维度，加载时用于检查配置是否变化"""
+        embeddings = self.kb.embeddings or self.embeddings
+        with open(os.path.join(path, "index_info.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(
+                self.kb.index_info or self.build_index_info(),
+                embedding_model=embeddings.model if embeddings else self.embedding_model,
+                embedding_dim=int(self.kb.dim) if self.kb.dim else None
+            ), f, ensure_ascii=False, indent=2)
+
+    def build_index_info(self, kb=None):
+        """本次构建使用的参数：以 kb（默认为当前版本）记录的索引类型和参数为基础，显式配置的 index_type / index_params 覆盖"""
+        kb = kb or self.kb
+        recorded = kb.index_info if kb else {}
+        return {
+            "index_type": self.index_type or recorded.get("index_type", "flat"),
+            "index_params": dict(recorded.get("index_params", {}), **self.index_params),
+            "splitter": self.splitter
+        }
+
+    def index_config_changed(self, index_info, kb=None):
+        """index_info 与 kb（默认为当前版本）记录的索引结构是否不同（只改查询参数不算）"""
+        recorded = (kb or self.kb).index_info
+        return build_config(index_info["index_type"], index_info["index_params"]) != build_config(
+            recorded.get("index_type", "flat"), recorded.get("index_params")
+        )
+
+    def update_vectorstore(self):
+        """增量更新知识库：只重新分割和向量化新增/修改的文件，并删除已移除文件的向量，成功后返回 True"""
+        with self.lock, self.metrics.span("update.total"):
+            return self._update_vectorstore()
+
+    def diff_files(self, manifest):
+        """对比当前文件和清单，返回 (新增, 修改, 删除)；内容未变仅修改时间变化的文件直接刷新 manifest 中的指纹"""
+        current_files = self.scan_files()
+        current_set = set(current_files)
+        added, changed = [], []
+        for file_path in current_files:
+            entry = manifest.get(file_path)
+            if entry is None:
+                added.append(file_path)
+                continue
+            stat = os.stat(file_path)
+            if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+                continue
+            # 大小或修改时间变化后再比较内容哈希，避免仅 touch 导致重新向量化
+            fingerprint = self.file_fingerprint(file_path)
+            if fingerprint["sha256"] == entry["sha256"]:
+                entry.update(fingerprint)
+            else:
+                changed.append(file_path)
+        removed = [path for path in manifest if path not in current_set]
+        return added, changed, removed
+
+    def _update_vectorstore(self):
+        if not self.kb or not self.kb.manifest:
+            # 没有可用的索引或清单时只能全量重建
+            self.reporter.info("未找到文件清单，执行全量重建...")
+            return self.initialize_bot()
+        if self.kb.path is None:
+            self.reporter.info("当前索引尚未保存，执行全量重建...")
+            return self.initialize_bot()
+        if not self.check_embedding_model():
+            return False
+        index_info = self.build_index_info()
+        if self.index_config_changed(index_info):
+            # 只重建部分分片会使各分片的索引类型或向量编码不一致
+            self.reporter.info(f"索引配置与当前版本记录的不同，执行全量重建（{index_info['index_type']}）...")
+            return self.initialize_bot()
+        
+        self.reporter.info("正在检查文档变更...")
+        # 在副本上修改，完成后整体替换，不影响正在使用旧索引的查询
+        manifest = {path: dict(entry) for path, entry in self.kb.manifest.items()}
+        added, changed, removed = self.diff_files(manifest)
+        
+        self.reporter.info(f"新增 {len(added)} 个，修改 {len(changed)} 个，删除 {len(removed)} 个文件")
+        
+        to_index = added + changed
+        if not to_index and not removed:
+            if manifest != self.kb.manifest:
+                # 只有修改时间变化时仍然需要刷新清单；已发布的版本不能修改（文件与其他版本以硬链接共用），
+                # 发布一个分片全部硬链接、只有清单不同的新版本
+                self.swap(KnowledgeBase(dict(self.kb.partitions), manifest, embeddings=self.kb.embeddings, index_info=index_info))
+                if not self.save_vectorstore():
+                    return False
+            self.reporter.success("知识库已是最新")
+            return True
+        
+        # 已修改和已移除文件的旧片段
+        stale_ids = {}
+        for file_path in changed + removed:
+            entry = manifest[file_path]
+            stale_ids.setdefault(entry["shard"], []).extend(entry["chunk_ids"])
+        for file_path in removed:
+            del manifest[file_path]
+        
+        # 重新读取和分割新增和修改的文件（与全量构建相同的流水线）
+        splits = []
+        loaded = 0
+        for file_path, docs, file_splits, fingerprint, error in ordered_map(
+            self.load_and_split, to_index, max_workers=self.load_workers
+        ):
+            if error is not None:
+                # 加载失败的文件不写入清单，下次更新时重试
+                self.reporter.error(f"加载失败 {os.path.basename(file_path)}：{error}")
+                manifest.pop(file_path, None)
+                continue
+            entry = self.manifest_entry(file_path, fingerprint)
+            for split in file_splits:
+                split.id = str(uuid.uuid4())
+                entry["chunk_ids"].append(split.id)
+            manifest[file_path] = entry
+            splits.extend(file_splits)
+            loaded += 1
+        if to_index:
+            self.reporter.success(f"共加载了 {loaded} 个文档，分割为 {len(splits)} 个片段")
+        new_splits = self.group_by_shard(splits)
+
+        # 只修改有变化的分片：支持原地修改的读入内存，其余的在构建工作目录中重建；未变化的分片沿用当前索引，保存时硬链接
+        touched = set(stale_ids) | set(new_splits)
+        workspace = self.snapshots.workspace()
+        kb = KnowledgeBase(dict(self.kb.partitions), manifest, embeddings=self.kb.embeddings, index_info=index_info, workspace=workspace)
+        try:
+            for name in touched:
+                ids = stale_ids.get(name, [])
+                group = new_splits.get(name, [])
+                partition = kb.partitions.pop(name, None)
+                path = os.path.join(workspace, name)
+                if partition is None:
+                    if group:
+                        kb.partitions[name] = self.create_partition(group, index_info, path)
+                elif supports_incremental(partition.vectorstore.index):
+                    # 精确索引和 PQ 索引支持原地删除和追加
+                    partition = self.read_partition(partition.path, writable=True, index_params=index_info["index_params"])
+                    if ids:
+                        partition.vectorstore.delete(ids)
+                        partition.lexical_index.remove(ids)
+                    if group:
+                        self.add_to_partition(partition, group)
+                    kb.partitions[name] = partition
+                else:
+                    # IVF/HNSW 不支持按位置删除，用剩余片段和新片段重建该分片（未变化片段的向量来自缓存）
+                    stale = set(ids)
+                    remaining = [doc for doc in self.partition_documents(partition) if doc.id not in stale]
+                    if remaining + group:
+                        kb.partitions[name] = self.create_partition(remaining + group, index_info, path)
+        except Exception:
+            self.snapshots.discard(workspace)
+            raise
+        
+        self.swap(kb)
+        self.reporter.end_progress("embedding")
+        if not self.save_vectorstore():
+            return False
+        self.reporter.success(f"知识库增量更新完成，共删除 {sum(len(ids) for ids in stale_ids.values())} 个片段")
+        return True
+
+    def rebuild(self):
+        """全量重建向量存储，完成前继续使用旧索引，成功后返回 True"""
+        with self.lock:
+            return self.initialize_bot()
+
+    def rebuild_sections(self, sections):
+        """只重建指定栏目的分片，其他分片的索引和文件保持不变，成功后返回 True；没有已保存的向量存储时执行全量重建"""
+        with self.lock:
+            if not self.kb or self.kb.path is None:
+                self.reporter.info("没有已保存的向量存储，执行全量重建...")
+                return self.initialize_bot()
+            if not self.check_embedding_model() or not check_ollama_service(self.reporter, self.base_url):
+                return False
+            index_info = self.build_index_info()
+            if self.index_config_changed(index_info):
+                # 其他栏目的分片仍是旧的索引结构，只能全部重建
+                self.reporter.info(f"索引配置与当前版本记录的不同，执行全量重建（{index_info['index_type']}）...")
+                return self.initialize_bot()
+            if self.embeddings is None:
+                self.embeddings = self.create_embeddings(self.base_url)
+            
+            sections = set(sections)
+            built = self.build_knowledge_base(self.scan_files(sections), index_info)
+            partitions = {name: partition for name, partition in self.kb.partitions.items() if shard_section(name) not in sections}
+            partitions.update(built.partitions)
+            manifest = {path: entry for path, entry in self.kb.manifest.items() if shard_section(entry["shard"]) not in sections}
+            manifest.update(built.manifest)
+            self.swap(KnowledgeBase(partitions, manifest, embeddings=built.embeddings, index_info=index_info, workspace=built.workspace))
+            self.reporter.success(f"已重建栏目 {', '.join(sorted(sections))}，共 {len(built.partitions)} 个分片")
+            return self.save_vectorstore()
+
+    def check_embedding_model(self):
+        """当前版本的向量模型与配置一致时才能在其上增量修改（新旧向量不能混在同一索引中），不一致时提示先迁移"""
+        model = self.kb.embeddings.model if self.kb and self.kb.embeddings else self.embedding_model
+        if model != self.embedding_model:
+            self.reporter.error(f"当前版本使用向量模型 {model}，与配置的 {self.embedding_model} 不一致，请先完成迁移或全量重建")
+            return False
+        return True
+
+    def partition_documents(self, partition):
+        """按向量位置顺序读取分片中的全部片段"""
+        vectorstore = partition.vectorstore
+        docstore = vectorstore.docstore
+        if isinstance(docstore, ChunkStore):
+            return docstore.documents()
+        return (docstore.search(vectorstore.index_to_docstore_id[position]) for position in range(vectorstore.index.ntotal))
+
+    def migrate_embeddings(self, reporter=None):
+        """把当前版本迁移到配置的向量模型，成功后返回 True
+
+        用新模型重新向量化当前版本的全部片段（片段 ID、正文和文件清单不变，不重新读取和分割文档），
+        按当前版本记录的索引类型和参数（显式配置的项覆盖）重建各分片并发布为新的快照版本；迁移期间继续使用旧版本和旧模型提供查询，
+        完成后索引和向量模型一起替换。向量化请求走后台通道，不挤占提问的 Ollama 槽位
+        """
+        reporter = reporter or self.reporter
+        with self.lock:
+            old = self.kb
+            if not old:
+                reporter.error("向量存储未加载，无法迁移")
+                return False
+            source_model = old.embeddings.model if old.embeddings else self.embedding_model
+            if source_model == self.embedding_model:
+                reporter.success(f"当前版本已使用向量模型 {self.embedding_model}")
+                return True
+            if not check_model_available(self.embedding_model, reporter, self.base_url):
+                return False
+            
+            start = time.time()
+            total = sum(partition.vectorstore.index.ntotal for partition in old.partitions.values())
+            self.migration = {"model": self.embedding_model, "done": 0, "total": total, "error": None}
+            # 沿用当前版本的索引结构（如 hnsw + int8），所有分片都会重建，显式配置的参数也可以一并生效
+            index_info = self.build_index_info(old)
+            reporter.info(f"正在把 {total} 个片段从 {source_model} 迁移到 {self.embedding_model}（{index_info['index_type']}）...")
+            workspace = self.snapshots.workspace()
+            try:
+                embeddings = self.create_embeddings(self.base_url)
+                embeddings.hits = embeddings.misses = 0
+                partitions = {}
+                for name, partition in old.partitions.items():
+                    builder = PartitionBuilder(
+                        embeddings, index_info["index_type"], index_info["index_params"], os.path.join(workspace, name)
+                    )
+                    for batch in batched(self.partition_documents(partition), self.pipeline_batch_size):
+                        with self.metrics.span("migrate.embed"):
+                            vectors = embeddings.embed_documents([doc.page_content for doc in batch])
+                        builder.add(batch, vectors)
+                        self.migration["done"] += len(batch)
+                        reporter.progress("migrate", self.migration["done"], total, f"已迁移 {self.migration['done']}/{total} 个片段")
+                    partitions[name] = builder.finish()
+                reporter.end_progress("embedding")
+                reporter.end_progress("migrate")
+            except Exception as e:
+                self.snapshots.discard(workspace)
+                self.migration["error"] = str(e)
+                self.metrics.incr("migrate.failures")
+                reporter.error(f"向量模型迁移失败：{str(e)}，继续使用 {source_model}")
+                return False
+            
+            self.embeddings = embeddings
+            self.swap(KnowledgeBase(partitions, dict(old.manifest), embeddings=embeddings, index_info=index_info, workspace=workspace))
+            self.metrics.observe_stage("migrate.total", time.time() - start)
+            self.metrics.incr("migrate.chunks", total)
+            reporter.success(f"已迁移到向量模型 {self.embedding_model}（{self.kb.dim} 维），向量缓存命中 {embeddings.hits} 个")
+            return self.save_vectorstore()
+
+    def start_migration(self):
+        """在后台线程中执行 migrate_embeddings（Web 服务启动时发现向量模型变化且 migrate_on_mismatch 时调用）"""
+        if self.migration_thread is not None and self.migration_thread.is_alive():
+            return
+        # 在后台线程中执行，不向界面输出消息，进度见 self.migration
+        self.migration_thread = threading.Thread(
+            target=self.migrate_embeddings, kwargs={"reporter": Reporter()}, name="embedding-migration", daemon=True
+        )
+        self.migration_thread.start()
+
+    def rollback(self, version=None):
+        """切换到指定的快照版本（默认为当前版本的上一个），成功后返回 True"""
+        with self.lock:
+            store = self.snapshots
+            versions = store.versions()
+            current = store.current_version()
+            if version is None:
+                older = versions[:versions.index(current)] if current in versions else versions
+                if not older:
+                    self.reporter.warning("没有可以回滚的旧版本")
+                    return False
+                version = older[-1]
+            elif version not in versions:
+                self.reporter.error(f"版本不存在：{version}，可用版本：{', '.join(versions) or '无'}")
+                return False
+            if self.embeddings is None:
+                self.embeddings = self.create_embeddings(self.base_url)
+            # 回滚到向量模型迁移之前的版本时，用该版本记录的模型加载，问题向量化随之切换
+            kb = self.read_knowledge_base(version=version, embedding_model=self.snapshot_embedding_model(version))
+            store.set_current(version)
+            self.adopt_embedding_model(kb)
+            self.swap(kb)
+            self.reporter.success(f"已回滚到版本 {version}")
+            return True
+
+    def snapshot_embedding_model(self, version=None):
+        """快照版本记录的向量模型，默认为当前版本（旧版本没有记录，当时固定使用 llama2）"""
+        store = self.snapshots
+        path = store.path(version) if version else store.current_path()
+        return self.load_index_info(path).get("embedding_model", "llama2")
+
+    def adopt_embedding_model(self, kb):
+        """改用 kb 的向量模型（回滚或热加载了用其他模型构建的版本），之后的增量更新也使用该模型，并提示修改配置"""
+        model = kb.embeddings.model
+        if model == self.embedding_model:
+            return
+        self.reporter.warning(
+            f"版本 {kb.version} 使用向量模型 {model}，与配置的 {self.embedding_model} 不一致，已切换到 {model}；"
+            f"请把 EMBEDDING_MODEL 改为 {model}，否则重启后会拒绝加载该版本"
+        )
+        self.embedding_model = model
+        self.embeddings = kb.embeddings
+        self.metrics.incr("snapshot.model_switches")
+
+    def start_reload_watcher(self):
+        """在后台定期检查 CURRENT 指针（间隔 reload_interval 秒），有新发布或回滚的版本时加载并替换"""
+        if self.reload_interval <= 0 or self.reload_thread is not None:
+            return
+        self.reload_thread = threading.Thread(target=self._watch_snapshots, name="snapshot-reload", daemon=True)
+        self.reload_thread.start()
+
+    def _watch_snapshots(self):
+        while True:
+            time.sleep(self.reload_interval)
+            self.reload_if_changed()
+
+    def reload_if_changed(self):
+        """指针指向的版本与正在使用的不同时加载该版本并替换，返回是否替换
+
+        新版本以内存映射方式打开，加载期间和替换后正在进行的查询继续使用旧版本；本进程正在构建或更新时跳过本轮
+        """
+        version = self.snapshots.current_version()
+        if version is None or (self.kb is not None and self.kb.version == version):
+            return False
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            if self.embeddings is None:
+                self.embeddings = self.create_embeddings(self.base_url)
+            with self.metrics.span("index.reload"):
+                # 在后台线程中执行，不向界面输出消息；新版本用其他向量模型构建（迁移或回滚）时按记录的模型加载
+                kb = self.read_knowledge_base(
+                    version=version, reporter=Reporter(), embedding_model=self.snapshot_embedding_model(version)
+                )
+            self.adopt_embedding_model(kb)
+            self.swap(kb)
+            self.metrics.incr("snapshot.reloads")
+            return True
+        except Exception:
+            self.metrics.incr("snapshot.reload_failures")
+            return False
+        finally:
+            self.lock.release()
+
+    def verify_vectorstore(self):
+        """检查当前知识库：各分片的向量、片段和词法索引条目一致，清单中的片段 ID 与索引一致，
+        文档没有未同步的变更；返回问题列表，为空表示通过"""
+        kb = self.kb
+        if not kb:
+            return ["向量存储未加载"]
+        problems = []
+        
+        indexed_ids = {}
+        for name, partition in kb.partitions.items():
+            vectorstore = partition.vectorstore
+            ids = list(vectorstore.index_to_docstore_id.values())
+            indexed_ids[name] = set(ids)
+            if len(ids) != vectorstore.index.ntotal:
+                problems.append(f"分片 {name}：向量数 {vectorstore.index.ntotal} 与片段映射数 {len(ids)} 不一致")
+            if len(indexed_ids[name]) != len(ids):
+                problems.append(f"分片 {name}：存在重复的片段 ID")
+            if len(partition.lexical_index) != len(ids):
+                problems.append(f"分片 {name}：词法索引条目数 {len(partition.lexical_index)} 与片段数 {len(ids)} 不一致")
+            missing = [doc_id for doc_id in ids if not isinstance(vectorstore.docstore.search(doc_id), Document)]
+            if missing:
+                problems.append(f"分片 {name}：{len(missing)} 个片段缺少正文")
+        
+        manifest_ids = {}
+        for entry in kb.manifest.values():
+            manifest_ids.setdefault(entry["shard"], set()).update(entry["chunk_ids"])
+        for name in set(indexed_ids) | set(manifest_ids):
+            extra = indexed_ids.get(name, set()) - manifest_ids.get(name, set())
+            lost = manifest_ids.get(name, set()) - indexed_ids.get(name, set())
+            if extra:
+                problems.append(f"分片 {name}：{len(extra)} 个片段不在文件清单中")
+            if lost:
+                problems.append(f"分片 {name}：文件清单中的 {len(lost)} 个片段不在索引中")
+        
+        manifest = {path: dict(entry) for path, entry in kb.manifest.items()}
+        added, changed, removed = self.diff_files(manifest)
+        if added or changed or removed:
+            problems.append(f"文档有未同步的变更：新增 {len(added)} 个，修改 {len(changed)} 个，删除 {len(removed)} 个文件")
+        return problems
+
+    def describe(self):
+        """当前知识库的概况：文件数、分片、索引类型、向量数和磁盘占用"""
+        kb = self.kb
+        info = {
+            "vector_store": os.path.abspath(kb.path) if kb and kb.path else None,
+            "snapshot": kb.version if kb else None,
+            "snapshots": self.snapshots.versions(),
+            "kb_version": self.kb_version(kb.manifest, kb.embeddings) if kb else None,
+            "embedding_model": kb.embeddings.model if kb and kb.embeddings else None,
+            "index_info": self.load_index_info(),
+            "files": len(kb.manifest) if kb else 0,
+            "partitions": {}
+        }
+        for name, partition in (kb.partitions.items() if kb else []):
+            index = partition.vectorstore.index
+            partition_path = os.path.join(kb.path or "", name)
+            info["partitions"][name] = {
+                "section": shard_section(name),
+                "language": shard_language(name),
+                "index_type": index_type_of(index),
+                "encoding": index_encoding_of(index),
+                "vectors": int(index.ntotal),
+                "dim": int(index.d),
+                "lexical_docs": len(partition.lexical_index),
+                "disk_bytes": sum(
+                    os.path.getsize(os.path.join(partition_path, file))
+                    for file in os.listdir(partition_path)
+                ) if os.path.isdir(partition_path) else 0
+            }
+        return info
+
+    def search_partition(self, question: str, query_vector, partition):
+        """在单个分片内做向量检索和 BM25 检索，返回 ([(片段ID, 距离, 位置)], [(片段ID, BM25 得分)], 最佳余弦相似度)"""
+        vectorstore = partition.vectorstore
+        distances, positions = vectorstore.index.search(query_vector, self.hybrid_fetch_k)
+        vector_hits = [
+            (vectorstore.index_to_docstore_id[int(position)], float(distance), int(position))
+            for position, distance in zip(positions[0], distances[0])
+            if position != -1
+        ]
+        best_cosine = 0.0
+        if vector_hits:
+            top_vector = vectorstore.index.reconstruct(int(positions[0][0]))
+            denominator = np.linalg.norm(top_vector) * np.linalg.norm(query_vector)
+            best_cosine = float(top_vector @ query_vector[0] / denominator) if denominator else 0.0
+        lexical_hits = partition.lexical_index.search(question, k=self.hybrid_fetch_k)
+        return vector_hits, lexical_hits, best_cosine
+
+    def search_shards(self, question: str, query_vector, kb, names):
+        """并行检索多个分片（FAISS 和 SQLite 查询期间释放 GIL），返回 [(分片名, 向量结果, 词法结果, 最佳余弦相似度)]"""
+        def search(name):
+            return (name,) + self.search_partition(question, query_vector, kb.partitions[name])
+        if len(names) <= 1:
+            return [search(name) for name in names]
+        return list(self.search_pool.map(search, names))
+
+    def retrieve(self, question: str, question_vector, kb, language=None, sections=None):
+        """混合检索：并行检索当前语言（及 common）的各个分片，合并向量和 BM25 结果后倒数排名融合，sections 指定只检索这些栏目的分片"""
+        query_vector = np.array([question_vector], dtype=np.float32)
+        if kb.dim is not None and query_vector.shape[1] != kb.dim:
+            raise Exception(f"问题向量为 {query_vector.shape[1]} 维，与索引的 {kb.dim} 维不一致，请检查向量模型配置")
+        candidates = [
+            name for name in kb.partitions
+            if not sections or shard_section(name) in sections
+        ]
+        names = [name for name in candidates if shard_language(name) in (language, "common")]
+        if not any(shard_language(name) == language for name in names):
+            names = candidates
+        
+        vector_hits, lexical_hits, owners, positions = [], [], {}, {}
+        best_cosine = 0.0
+        for name, partition_vector, partition_lexical, cosine in self.search_shards(question, query_vector, kb, names):
+            vector_hits.extend(partition_vector)
+            lexical_hits.extend(partition_lexical)
+            owners.update((hit[0], name) for hit in partition_vector + partition_lexical)
+            positions.update((doc_id, position) for doc_id, _, position in partition_vector)
+            best_cosine = max(best_cosine, cosine)
+        
+        # 本语言结果相似度太低时回退到其他语言的分片
+        if self.cross_language_threshold is not None and best_cosine < self.cross_language_threshold:
+            others = [name for name in candidates if name not in names]
+            for name, partition_vector, partition_lexical, _ in self.search_shards(question, query_vector, kb, others):
+                vector_hits.extend(partition_vector)
+                lexical_hits.extend(partition_lexical)
+                owners.update((hit[0], name) for hit in partition_vector + partition_lexical)
+                positions.update((doc_id, position) for doc_id, _, position in partition_vector)
+        
+        vector_ids = [hit[0] for hit in sorted(vector_hits, key=lambda hit: hit[1])]
+        lexical_ids = [doc_id for doc_id, _ in sorted(lexical_hits, key=lambda hit: hit[1], reverse=True)]
+        fused_ids = reciprocal_rank_fusion([vector_ids, lexical_ids])[:self.candidate_k]
+        with self.metrics.span("query.select"):
+            return self.select_context(query_vector[0], fused_ids, kb, owners, positions)
+
+    def select_context(self, query_vector, fused_ids, kb, owners, positions):
+        """从融合排序的候选中选出写入提示词的片段：按余弦相似度的得分断崖截断，MMR 去掉冗余片段，
+        再按顺序装入 context_token_budget（片段数不超过 retrieval_k），提示词长度随问题自适应且有上限"""
+        if not fused_ids:
+            return []
+        vectors = normalize(np.vstack([
+            kb.partitions[owners[doc_id]].vectorstore.index.reconstruct(
+                positions[doc_id] if doc_id in positions else int(kb.partitions[owners[doc_id]].position_of(doc_id))
+            )
+            for doc_id in fused_ids
+        ]))
+        relevance = vectors @ normalize(query_vector)
+        # 融合排序的第一名总是保留（BM25 精确命中的片段余弦相似度可能不高）
+        keep = score_gap_cutoff(relevance, self.score_gap)
+        keep[0] = True
+        kept = np.flatnonzero(keep)
+        order = mmr_select(
+            relevance[kept], vectors[kept], self.retrieval_k,
+            lambda_mult=self.mmr_lambda, duplicate_threshold=self.duplicate_threshold
+        )
+        docs = [
+            kb.partitions[owners[fused_ids[kept[index]]]].vectorstore.docstore.search(fused_ids[kept[index]])
+            for index in order
+        ]
+        packed, tokens = pack_by_tokens([doc.page_content for doc in docs], self.context_token_budget)
+        self.metrics.observe("context_chunks", len(packed))
+        self.metrics.observe("context_tokens", tokens)
+        return [
+            docs[index] if text is docs[index].page_content
+            else Document(id=docs[index].id, page_content=text, metadata=docs[index].metadata)
+            for index, text in packed
+        ]
+
+    def sections_of(self, kb=None):
+        """知识库中已索引的栏目"""
+        kb = kb or self.kb
+        return sorted({shard_section(name) for name in kb.partitions}) if kb else []
+
+    def build_prompt(self, question: str, docs, history: str = None):
+        """把检索到的片段（以及多轮对话的历史）填入问答提示词"""
+        context = "\n\n".join(doc.page_content for doc in docs)
+        if history:
+            return CONVERSATION_PROMPT.format(context=context, history=history, question=question)
+        return QA_PROMPT.format(context=context, question=question)
+
+    def query_stream(self, question: str, cancel_event=None, language=None, on_queue=None, memory=None, sections=None):
+        """流式处理用户查询，逐个产出 token；设置 cancel_event 或关闭生成器会中止 Ollama 生成；
+        language 指定检索的语言，sections 指定只检索这些栏目（如 ["api", "option"]）
+
+        传入会话的 ConversationMemory 时按多轮对话处理：检索使用结合上一轮问题的独立问题，提示词中加入对话历史，
+        完整的回答写回 memory
+
+        与其他会话共用 Ollama 槽位，繁忙时排队并调用 on_queue(排队位置)；排队超过 queue_timeout 抛出 QueueTimeout，
+        排队期间设置 cancel_event 抛出 RequestCancelled
+        """
+        kb = self.kb
+        if not kb:
+            raise Exception("问答链未初始化")
+        start = time.time()
+        with self.scheduler.slot(INTERACTIVE, self.queue_timeout, cancel_event, on_queue) as ticket:
+            self.metrics.observe_stage("query.queue", ticket.waited)
+            yield from self.answer_stream(question, kb, cancel_event, language, start, memory, sections)
+
+    def answer_stream(self, question: str, kb, cancel_event, language, start, memory=None, sections=None):
+        """向量化问题、查找答案缓存、检索并流式生成回答（在已占用的调度槽位中执行）"""
+        # 追问（如 "那柱状图呢？"）单独检索不到相关内容，结合上一轮问题检索；有历史时回答依赖上下文，不使用答案缓存
+        follow_up = bool(memory)
+        # 答案缓存不区分检索范围，限定栏目时不读写缓存
+        use_cache = not follow_up and not sections
+        search_query = memory.retrieval_query(question) if follow_up else question
+        answer_start = time.perf_counter()
+        embed_stats = {}
+        with self.metrics.span("query.embed"):
+            # 使用构建该版本的向量模型（迁移完成前后问题向量都与索引一致）
+            question_vector = (kb.embeddings or self.embeddings).embed_query(search_query, embed_stats)
+        
+        # 相同或相近的问题直接返回缓存答案
+        if use_cache:
+            with self.metrics.span("query.answer_cache"):
+                cached = self.answer_cache.lookup(question_vector, language)
+            if cached is not None:
+                self.metrics.observe_stage("query.total", time.time() - start)
+                if memory is not None:
+                    memory.add(question, cached)
+                yield cached
+                return
+        
+        with self.metrics.span("query.retrieve"):
+            docs = self.retrieve(search_query, question_vector, kb, language, sections)
+        with self.metrics.span("query.prompt"):
+            prompt = self.build_prompt(question, docs, memory.history() if follow_up else None)
+        self.metrics.observe("prompt_tokens", estimate_tokens(prompt))
+        answer = ""
+        tokens = 0
+        first_token = None
+        stats = {}
+        completed = False
+        generate_start = time.perf_counter()
+        try:
+            for token in self.llm_client.generate_stream(self.llm_model, prompt, cancel_event, stats):
+                if first_token is None:
+                    first_token = time.perf_counter() - answer_start
+                tokens += 1
+                answer += token
+                yield token
+            completed = not (cancel_event is not None and cancel_event.is_set())
+        finally:
+            # 生成耗时包含调用方处理 token 的时间；被中止（停止按钮、关闭生成器或出错）的生成单独计数
+            # 只按 Ollama 报告的模型加载耗时判断冷启动（CPU 上问题向量化本身就可能超过阈值，不能按耗时判断）
+            load_duration = max(embed_stats.get("load_duration", 0), stats.get("load_duration", 0))
+            cold = load_duration / 1e9 > COLD_LOAD_SECONDS
+            self.record_generation(tokens, first_token, cold, time.perf_counter() - generate_start, time.time() - start)
+            if not completed:
+                self.metrics.incr("query.interrupted")
+        
+        # 被中止的回答不完整，不写入缓存和对话记忆
+        if answer and completed:
+            # 回答期间索引被替换（如迁移到新的向量模型）时不写入缓存
+            if use_cache and kb is self.kb:
+                self.answer_cache.put(question, question_vector, answer, time.time() - start, language)
+            if memory is not None:
+                memory.add(question, answer)
+
+    def record_generation(self, tokens, first_token, cold, generate_seconds, total_seconds):
+        """记录一次生成的耗时、token 数和生成速度；首个 token 耗时（从开始处理到第一个 token，不含排队）分为冷启动和热启动两组"""
+        if first_token is not None:
+            self.metrics.observe_stage("query.first_token", first_token)
+            self.metrics.observe_stage("query.first_token_cold" if cold else "query.first_token_warm", first_token)
+        if cold:
+            self.metrics.incr("cold_starts")
+        self.metrics.observe_stage("query.generate", generate_seconds)
+        self.metrics.observe_stage("query.total", total_seconds)
+        self.metrics.incr("generated_tokens", tokens)
+        if tokens and generate_seconds > 0:
+            self.metrics.observe("generation_tokens_per_second", tokens / generate_seconds)
+
+    def query(self, question: str, language=None, sections=None):
+        """处理用户查询"""
+        try:
+            return "".join(self.query_stream(question, language=language, sections=sections))
+        except Exception as e:
+            return f"发生错误：{str(e)}"
+
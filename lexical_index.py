@@ -0,0 +1,177 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+# 英文标识符（含点号路径，如 series.label.position）
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*(?:\.[A-Za-z_$][A-Za-z0-9_$]*)*")
+# 驼峰拆分，如 updateSpec -> update, Spec
+CAMEL_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+# 中日韩文字
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+")
+NUMBER_PATTERN = re.compile(r"\b[0-9]+(?:\.[0-9]+)?\b")
+
+
+def tokenize(text: str) -> List[str]:
+    """分词：中文按单字和二元组切分，英文保留完整标识符/路径并拆分驼峰和下划线"""
+    tokens = []
+    for match in IDENTIFIER_PATTERN.finditer(text):
+        identifier = match.group(0)
+        lower = identifier.lower()
+        tokens.append(lower)
+        if "." in identifier:
+            parts = identifier.split(".")
+            tokens.extend(part.lower() for part in parts)
+        else:
+            parts = [identifier]
+        for part in parts:
+            words = [w.lower() for w in CAMEL_PATTERN.findall(part.replace("_", " ").replace("$", " "))]
+            if len(words) > 1:
+                tokens.extend(words)
+    for match in CJK_PATTERN.finditer(text):
+        run = match.group(0)
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(NUMBER_PATTERN.findall(text))
+    return tokens
+
+
+# 倒排索引的 SQLite 表：postings 每行一个 (词, 片段, 词频)，按词查询；片段 ID 和长度只在 doc_lengths 中保存一份，
+# postings 用整数编号引用片段，按片段删除时走 postings_doc 索引
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS doc_lengths (doc INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE, length INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc);
+"""
+
+
+# BM25 倒排索引，和向量索引使用相同的片段 ID，保存在 SQLite 中：新建和 load() 得到的索引默认在内存数据库中增删，
+# save() 时写入文件；新建时指定 path 则直接写入该文件（构建时按批写入）；open() 只读打开已保存的文件，查询时按词读取倒排表
+class LexicalIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75, conn: sqlite3.Connection = None, path: str = ":memory:"):
+        self._lock = threading.Lock()
+        if conn is None:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.executescript(SCHEMA)
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [("k1", k1), ("b", b), ("doc_count", 0), ("total_length", 0)])
+        self._conn = conn
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self.doc_count = int(meta["doc_count"])
+        self.total_length = meta["total_length"]
+
+    def add(self, doc_id: str, text: str):
+        """加入一个片段"""
+        self.add_many([(doc_id, text)])
+
+    def add_many(self, items: Iterable[Tuple[str, str]]):
+        """加入多个片段，已存在的片段 ID 先删除再加入"""
+        with self._lock, self._conn:
+            for doc_id, text in items:
+                self._remove(doc_id)
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                cursor = self._conn.execute("INSERT INTO doc_lengths (doc_id, length) VALUES (?, ?)", (doc_id, length))
+                self._conn.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?)", ((term, cursor.lastrowid, tf) for term, tf in terms.items())
+                )
+                self.doc_count += 1
+                self.total_length += length
+            self._write_meta()
+
+    def remove(self, doc_ids: Iterable[str]):
+        """删除片段"""
+        with self._lock, self._conn:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+            self._write_meta()
+
+    def _remove(self, doc_id: str):
+        row = self._conn.execute("SELECT doc, length FROM doc_lengths WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return
+        self._conn.execute("DELETE FROM postings WHERE doc = ?", (row[0],))
+        self._conn.execute("DELETE FROM doc_lengths WHERE doc = ?", (row[0],))
+        self.doc_count -= 1
+        self.total_length -= row[1]
+
+    def _write_meta(self):
+        self._conn.executemany("UPDATE meta SET value = ? WHERE key = ?", [
+            (self.doc_count, "doc_count"), (self.total_length, "total_length")
+        ])
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """BM25 检索，返回 [(片段ID, 分数)]，按分数降序"""
+        postings = {}
+        with self._lock:
+            for term in set(tokenize(query)):
+                rows = self._conn.execute(
+                    "SELECT d.doc_id, p.tf, d.length FROM postings p JOIN doc_lengths d ON d.doc = p.doc WHERE p.term = ?",
+                    (term,)
+                ).fetchall()
+                if rows:
+                    postings[term] = rows
+        return bm25_search(postings, self.doc_count, self.total_length, self.k1, self.b, k)
+
+    def __len__(self):
+        return self.doc_count
+
+    def save(self, path: str):
+        """写入 SQLite 文件（VACUUM INTO 生成紧凑的副本，先写临时文件再替换）"""
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with self._lock:
+            self._conn.execute("VACUUM INTO ?", (tmp_path,))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        """复制到内存数据库，用于增量更新（只复制一个分片，已发布的文件不修改）"""
+        source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        source.backup(conn)
+        source.close()
+        return cls(conn=conn)
+
+    @classmethod
+    def open(cls, path: str) -> "LexicalIndex":
+        """只读打开，查询时按词读取倒排表，打开耗时与语料规模无关"""
+        return cls(conn=sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def bm25_search(postings: Dict[str, list], doc_count: int, total_length: float, k1: float, b: float, k: int) -> List[Tuple[str, float]]:
+    """根据查询词的倒排表 {词: [(片段ID, 词频, 片段长度)]} 计算 BM25 分数"""
+    if doc_count == 0:
+        return []
+    avg_length = total_length / doc_count
+    scores: Dict[str, float] = {}
+    for posting in postings.values():
+        idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+        for doc_id, tf, length in posting:
+            norm = k1 * (1 - b + b * length / avg_length)
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """倒数排名融合：合并多路检索结果的排序"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,196 @@
+import os
+import re
+from typing import Iterable, List, Tuple
+
+from langchain_core.documents import Document
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+FENCE_PATTERN = re.compile(r"^\s*(`{3,}|~{3,})")
+LANGUAGE_DIRS = ("zh", "en")
+# 中英文句末标点，超长段落按句切分
+SENTENCE_PATTERN = re.compile(r"(?<=[。！？；.!?;])\s*")
+
+# 标题路径：((级别, 标题), ...)
+Path = Tuple[Tuple[int, str], ...]
+
+
+# 按 Markdown 结构分割文档：以标题层级为边界，代码块和表格不拆开（超过上限时按行拆分并补齐围栏/表头），
+# 过小的相邻小节合并，每个片段以标题路径开头（如 "API > vchart > updateSpec"）
+class MarkdownSplitter:
+    def __init__(self, chunk_size: int = 1000, min_chunk_size: int = 200, max_block_size: int = 2000):
+        self.chunk_size = chunk_size  # 片段正文的目标长度（字符）
+        self.min_chunk_size = min_chunk_size  # 小于该长度的片段尝试与下一小节合并
+        self.max_block_size = max_block_size  # 代码块和表格保持完整的长度上限
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        splits = []
+        for doc in documents:
+            for breadcrumb, text in self.split_text(doc.page_content, doc.metadata.get("source")):
+                metadata = dict(doc.metadata, headings=breadcrumb)
+                splits.append(Document(page_content=text, metadata=metadata))
+        return splits
+
+    def split_text(self, text: str, source: str = None) -> List[Tuple[str, str]]:
+        """返回 [(标题路径, 片段文本)]，片段文本已带标题路径前缀"""
+        text, title = self._strip_front_matter(text)
+        units = self._units(text)
+        if not units:
+            return []
+        # 标题路径的根：所在目录（语言目录除外），没有一级标题时再加上 front matter 标题或文件名
+        root = []
+        if source:
+            parent = os.path.basename(os.path.dirname(source))
+            if parent and parent not in LANGUAGE_DIRS:
+                root.append(parent)
+        title = title or (os.path.splitext(os.path.basename(source))[0] if source else None)
+
+        chunks = []
+        current, size = [], 0
+        for path, block in units:
+            if current:
+                same_section = path == current[-1][0]
+                fits = size + len(block) <= self.chunk_size
+                # 同一小节内装满为止；不同小节只有当前片段过小时才合并
+                if not fits or (not same_section and size >= self.min_chunk_size):
+                    chunks.append(current)
+                    current, size = [], 0
+            current.append((path, block))
+            size += len(block)
+        if current:
+            chunks.append(current)
+
+        return [self._render(chunk, root, title) for chunk in chunks]
+
+    def _render(self, chunk: List[Tuple[Path, str]], root: List[str], title: str) -> Tuple[str, str]:
+        """拼接片段：标题路径取各小节的公共前缀，更深的标题以原标题行写入正文"""
+        prefix = chunk[0][0]
+        for path, _ in chunk[1:]:
+            prefix = _common_prefix(prefix, path)
+        titles = [heading for _, heading in prefix]
+        if title and (not prefix or prefix[0][0] > 1):
+            titles.insert(0, title)
+        breadcrumb = " > ".join(root + titles)
+
+        parts = []
+        previous = prefix
+        for path, block in chunk:
+            if path != previous:
+                shared = len(_common_prefix(previous, path))
+                for level, title in path[max(shared, len(prefix)):]:
+                    parts.append(f"{'#' * level} {title}")
+                previous = path
+            parts.append(block)
+        body = "\n\n".join(parts)
+        return breadcrumb, f"{breadcrumb}\n\n{body}" if breadcrumb else body
+
+    def _units(self, text: str) -> List[Tuple[Path, str]]:
+        """把正文切成带标题路径的最小单元：段落、完整代码块、完整表格，超长单元再按行/句切分"""
+        units = []
+        path: Path = ()
+        lines = text.split("\n")
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            fence = FENCE_PATTERN.match(line)
+            heading = HEADING_PATTERN.match(line)
+            if fence:
+                marker = fence.group(1)
+                end = i + 1
+                while end < len(lines) and not lines[end].strip().startswith(marker):
+                    end += 1
+                block = lines[i:end + 1]
+                i = end + 1
+                units.extend((path, piece) for piece in self._split_code(block, marker))
+            elif heading:
+                level = len(heading.group(1))
+                path = tuple(item for item in path if item[0] < level) + ((level, heading.group(2)),)
+                i += 1
+            elif line.lstrip().startswith("|"):
+                end = i
+                while end < len(lines) and lines[end].lstrip().startswith("|"):
+                    end += 1
+                units.extend((path, piece) for piece in self._split_table(lines[i:end]))
+                i = end
+            elif not line.strip():
+                i += 1
+            else:
+                end = i
+                while (end < len(lines) and lines[end].strip() and not FENCE_PATTERN.match(lines[end])
+                       and not HEADING_PATTERN.match(lines[end]) and not lines[end].lstrip().startswith("|")):
+                    end += 1
+                units.extend((path, piece) for piece in self._split_paragraph(lines[i:end]))
+                i = end
+        return units
+
+    def _split_code(self, lines: List[str], marker: str) -> List[str]:
+        """代码块不超过上限时保持完整，否则按行拆分，每段补齐开闭围栏"""
+        block = "\n".join(lines)
+        if len(block) <= self.max_block_size:
+            return [block]
+        opening = lines[0]
+        body = lines[1:-1] if len(lines) > 1 and lines[-1].strip().startswith(marker) else lines[1:]
+        budget = self.max_block_size - len(opening) - len(marker) - 2
+        return [f"{opening}\n{piece}\n{marker}" for piece in _pack_lines(body, budget)]
+
+    def _split_table(self, lines: List[str]) -> List[str]:
+        """表格不超过上限时保持完整，否则按行拆分，每段重复表头"""
+        block = "\n".join(lines)
+        if len(block) <= self.max_block_size or len(lines) <= 2:
+            return [block]
+        header = "\n".join(lines[:2])
+        budget = self.max_block_size - len(header) - 1
+        return [f"{header}\n{piece}" for piece in _pack_lines(lines[2:], budget)]
+
+    def _split_paragraph(self, lines: List[str]) -> List[str]:
+        """段落超过片段长度时先按行、再按句切分"""
+        paragraph = "\n".join(lines)
+        if len(paragraph) <= self.chunk_size:
+            return [paragraph]
+        pieces = []
+        for line in lines:
+            if len(line) <= self.chunk_size:
+                pieces.append(line)
+            else:
+                pieces.extend(sentence for sentence in SENTENCE_PATTERN.split(line) if sentence)
+        return _pack_lines(pieces, self.chunk_size)
+
+    @staticmethod
+    def _strip_front_matter(text: str) -> Tuple[str, str]:
+        """去掉 YAML front matter，返回 (正文, front matter 中的 title)"""
+        if not text.startswith("---"):
+            return text, None
+        end = text.find("\n---", 3)
+        if end == -1:
+            return text, None
+        title = None
+        for line in text[3:end].split("\n"):
+            if line.startswith("title:"):
+                title = line[len("title:"):].strip().strip("'\"") or None
+        return text[end + 4:].lstrip("\n"), title
+
+
+def _pack_lines(lines: List[str], budget: int) -> List[str]:
+    """把行依次装入不超过 budget 的段；单行超长时按字符硬切"""
+    pieces, current, size = [], [], 0
+    for line in lines:
+        while len(line) > budget:
+            if current:
+                pieces.append("\n".join(current))
+                current, size = [], 0
+            pieces.append(line[:budget])
+            line = line[budget:]
+        if current and size + len(line) + 1 > budget:
+            pieces.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def _common_prefix(a: Path, b: Path) -> Path:
+    length = 0
+    while length < min(len(a), len(b)) and a[length] == b[length]:
+        length += 1
+    return a[:length]
@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+# 关闭统计时 span() 返回的空上下文，不计时也不加锁
+NULL_SPAN = nullcontext()
+
+
+# 滚动窗口直方图：累计次数和总和，分位数只按最近 window 个样本计算
+class RollingHistogram:
+    def __init__(self, window: int = 1024):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def summary(self) -> dict:
+        summary = {"count": self.count, "sum": self.sum}
+        if self.samples:
+            values = np.percentile(np.fromiter(self.samples, dtype=np.float64), [q * 100 for q in QUANTILES])
+            summary.update((f"p{int(q * 100)}", float(value)) for q, value in zip(QUANTILES, values))
+        return summary
+
+
+# 计时区间：退出时把耗时（秒）记入对应阶段
+class Span:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe_stage(self.stage, time.perf_counter() - self.start)
+
+
+# 进程内的延迟和计数统计：各阶段耗时（stages）、其他数值分布（values，如 tokens/s）、计数器和按需计算的指标
+class Metrics:
+    def __init__(self, enabled: bool = True, window: int = 1024, prefix: str = "rag"):
+        self.enabled = enabled  # 关闭后 span/observe/incr 直接返回
+        self.window = window
+        self.prefix = prefix  # 文本格式中指标名的前缀
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._values = {}
+        self._counters = {}
+        self._gauges = {}  # 名称 -> 无参函数，导出时调用
+
+    def span(self, stage: str):
+        """返回计时上下文：with metrics.span("query.retrieve"): ..."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, stage)
+
+    def observe_stage(self, stage: str, seconds: float):
+        self._observe(self._stages, stage, seconds)
+
+    def observe(self, name: str, value: float):
+        self._observe(self._values, name, value)
+
+    def _observe(self, table: dict, name: str, value: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = table.get(name)
+            if histogram is None:
+                histogram = table[name] = RollingHistogram(self.window)
+            histogram.observe(value)
+
+    def incr(self, name: str, amount: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def gauge(self, name: str, func):
+        """注册按需计算的指标（如缓存命中率），导出时调用 func()"""
+        self._gauges[name] = func
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._values.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = {
+                "stages": {name: histogram.summary() for name, histogram in self._stages.items()},
+                "values": {name: histogram.summary() for name, histogram in self._values.items()},
+                "counters": dict(self._counters)
+            }
+        gauges = {}
+        for name, func in self._gauges.items():
+            try:
+                gauges[name] = float(func())
+            except Exception:
+                continue
+        snapshot["gauges"] = gauges
+        return snapshot
+
+    def render_text(self) -> str:
+        """导出为 Prometheus 文本格式，可由 Prometheus 或 node_exporter 文本收集器抓取"""
+        snapshot = self.snapshot()
+        lines = []
+        if snapshot["stages"]:
+            family = f"{self.prefix}_stage_seconds"
+            lines += [f"# HELP {family} 各阶段耗时（秒），分位数按最近 {self.window} 个样本计算", f"# TYPE {family} summary"]
+            for stage, summary in sorted(snapshot["stages"].items()):
+                lines += _summary_lines(family, f'stage="{stage}"', summary)
+        for name, summary in sorted(snapshot["values"].items()):
+            family = f"{self.prefix}_{_metric_name(name)}"
+            lines.append(f"# TYPE {family} summary")
+            lines += _summary_lines(family, "", summary)
+        for name, value in sorted(snapshot["counters"].items()):
+            family = f"{self.prefix}_{_metric_name(name)}_total"
+            lines += [f"# TYPE {family} counter", f"{family} {value}"]
+        for name, value in sorted(snapshot["gauges"].items()):
+            family = f"{self.prefix}_{_metric_name(name)}"
+            lines += [f"# TYPE {family} gauge", f"{family} {value:.6g}"]
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name: str) -> str:
+    return "".join(char if char.isalnum() else "_" for char in name)
+
+
+def _summary_lines(family: str, labels: str, summary: dict):
+    separator = "," if labels else ""
+    lines = [
+        f'{family}{{{labels}{separator}quantile="{q}"}} {summary[f"p{int(q * 100)}"]:.6g}'
+        for q in QUANTILES if f"p{int(q * 100)}" in summary
+    ]
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{family}_sum{suffix} {summary['sum']:.6g}")
+    lines.append(f"{family}_count{suffix} {summary['count']}")
+    return lines
+
+
+# 在后台线程中提供 GET /metrics，返回 Prometheus 文本格式
+def serve_metrics(metrics: Metrics, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            data = metrics.render_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
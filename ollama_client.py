@@ -0,0 +1,267 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from typing import Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.embeddings import Embeddings
+
+from scheduler import Scheduler, BACKGROUND
+
+# Ollama 服务地址，可通过环境变量 OLLAMA_BASE_URL 指向其他主机或本地替身服务（ollama_stub.py）
+DEFAULT_BASE_URL = "http://127.0.0.1:11434"
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "[::1]")
+# 生成结果中的 load_duration 超过该值（秒）视为冷启动：模型在这次请求中才被加载
+COLD_LOAD_SECONDS = 0.5
+
+
+def ollama_endpoints(base_url: str = None) -> List[str]:
+    """健康检查尝试的地址：本机地址时同时尝试其他回环写法（同一端口）"""
+    base_url = (base_url or os.environ.get("OLLAMA_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+    parts = urlsplit(base_url)
+    host = f"[{parts.hostname}]" if parts.hostname and ":" in parts.hostname else parts.hostname
+    if host not in LOOPBACK_HOSTS:
+        return [base_url]
+    port = f":{parts.port}" if parts.port else ""
+    return [base_url] + [f"{parts.scheme}://{other}{port}" for other in LOOPBACK_HOSTS if other != host]
+
+
+# 一次健康探测的结果：第一个响应的地址和其上已下载的模型
+class OllamaStatus:
+    def __init__(self, endpoint: Optional[str], models: List[str], errors: Dict[str, str]):
+        self.endpoint = endpoint  # 探测成功的地址，全部失败时为 None
+        self.models = models
+        self.errors = errors  # 地址 -> 失败原因（只包含成功之前已返回的地址）
+        self.checked_at = time.time()
+
+    @property
+    def ok(self) -> bool:
+        return self.endpoint is not None
+
+    def has_model(self, name: str) -> bool:
+        """未写标签的模型名等同于 :latest"""
+        return name in self.models or f"{name}:latest" in self.models
+
+
+_probe_cache: Dict[str, OllamaStatus] = {}
+_probe_lock = threading.Lock()
+
+
+def probe_ollama(
+    base_url: str = None,
+    connect_timeout: float = 0.3,
+    read_timeout: float = 2.0,
+    ttl: float = 10.0,
+    failure_ttl: float = 2.0,
+    force: bool = False
+) -> OllamaStatus:
+    """并发请求各地址的 /api/tags（不加载模型），取第一个成功的结果
+
+    结果在进程内按地址缓存（成功 ttl 秒，失败 failure_ttl 秒），所有会话共享；
+    同一时刻只有一次探测在进行，其他调用等待并复用其结果
+    """
+    endpoints = ollama_endpoints(base_url)
+    with _probe_lock:
+        cached = _probe_cache.get(endpoints[0])
+        if cached is not None and not force:
+            if time.time() - cached.checked_at < (ttl if cached.ok else failure_ttl):
+                return cached
+        status = _probe_endpoints(endpoints, (connect_timeout, read_timeout))
+        _probe_cache[endpoints[0]] = status
+        return status
+
+
+def _probe_endpoints(endpoints: List[str], timeout) -> OllamaStatus:
+    errors = {}
+    pool = ThreadPoolExecutor(max_workers=len(endpoints))
+    try:
+        futures = {pool.submit(_list_models, endpoint, timeout): endpoint for endpoint in endpoints}
+        for future in as_completed(futures):
+            endpoint = futures[future]
+            try:
+                return OllamaStatus(endpoint, future.result(), errors)
+            except Exception as e:
+                errors[endpoint] = str(e)
+        return OllamaStatus(None, [], errors)
+    finally:
+        # 不等待仍在超时中的地址（如不可用的 IPv6 回环）
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _list_models(endpoint: str, timeout) -> List[str]:
+    response = requests.get(f"{endpoint}/api/tags", timeout=timeout)
+    response.raise_for_status()
+    return [model["name"] for model in response.json().get("models", [])]
+
+
+# 复用 keep-alive 连接池的 Ollama HTTP 客户端
+class OllamaClient:
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, pool_size: int = 8, timeout: float = 120, keep_alive=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.keep_alive = keep_alive  # 模型空闲后在 Ollama 中保留的时长（如 "30m"，-1 表示一直保留），None 使用服务端默认值
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def embed(self, model: str, text: str, stats: dict = None) -> List[float]:
+        """向量化单条文本；传入 stats 时写入响应中的统计信息（load_duration 等，单位纳秒，服务端没有返回的字段不写入）"""
+        response = self.session.post(
+            f"{self.base_url}/api/embeddings",
+            json=self._payload(model=model, prompt=text),
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        result = response.json()
+        if stats is not None:
+            stats.update((key, value) for key, value in result.items() if key != "embedding")
+        return result["embedding"]
+
+    def load(self, model: str, embedding: bool = False) -> float:
+        """让 Ollama 加载模型并按 keep_alive 保留（不生成内容），返回耗时（秒）"""
+        start = time.perf_counter()
+        if embedding:
+            response = self.session.post(
+                f"{self.base_url}/api/embeddings",
+                json=self._payload(model=model, prompt=""),
+                timeout=self.timeout
+            )
+        else:
+            # 不带 prompt 的生成请求只加载模型
+            response = self.session.post(
+                f"{self.base_url}/api/generate",
+                json=self._payload(model=model, stream=False),
+                timeout=self.timeout
+            )
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    def generate_stream(
+        self,
+        model: str,
+        prompt: str,
+        cancel_event: Optional[threading.Event] = None,
+        stats: Optional[dict] = None
+    ) -> Iterator[str]:
+        """流式生成回答，逐个产出 token；取消或提前关闭生成器时断开连接，Ollama 随之停止生成
+
+        传入 stats 时写入最后一个分块中的统计信息（load_duration、eval_count 等，单位纳秒）
+        """
+        response = self.session.post(
+            f"{self.base_url}/api/generate",
+            json=self._payload(model=model, prompt=prompt, stream=True),
+            stream=True,
+            timeout=self.timeout
+        )
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    if stats is not None:
+                        stats.update(chunk)
+                    break
+        finally:
+            # 未读完的流式响应在关闭时会断开底层连接，而不是放回连接池
+            response.close()
+
+    def _payload(self, **fields) -> dict:
+        if self.keep_alive is not None:
+            fields["keep_alive"] = self.keep_alive
+        return fields
+
+    def close(self):
+        self.session.close()
+
+
+# 分批并发向量化：有界线程池 + 在途批次上限（背压），失败批次单独重试；
+# /api/embeddings 每个请求只接受一个文本，batch_size 只决定分给线程的工作量和重试单位，不是每个请求的片段数
+class OllamaBatchEmbeddings(Embeddings):
+    def __init__(
+        self,
+        client: OllamaClient,
+        model: str = "llama2",
+        batch_size: int = 16,
+        max_workers: int = 4,
+        max_retries: int = 3,
+        progress_callback: Optional[Callable[[int, int, float], None]] = None,
+        scheduler: Optional[Scheduler] = None
+    ):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.progress_callback = progress_callback  # (已完成片段数, 总片段数, 片段/秒)
+        self.scheduler = scheduler  # 批量向量化走 background 通道，有用户提问排队时让出槽位
+        self.last_throughput = 0.0
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """向量化一个批次，失败时保留已完成部分，只重试剩余文本"""
+        vectors = []
+        attempt = 0
+        while len(vectors) < len(texts):
+            try:
+                vectors.append(self._embed(texts[len(vectors)]))
+            except requests.RequestException:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                time.sleep(min(2 ** attempt, 30))
+        return vectors
+
+    def _embed(self, text: str) -> List[float]:
+        if self.scheduler is None:
+            return self.client.embed(self.model, text)
+        with self.scheduler.slot(BACKGROUND):
+            return self.client.embed(self.model, text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """并发向量化所有文本，结果顺序与输入一致"""
+        total = len(texts)
+        batches = [texts[i:i + self.batch_size] for i in range(0, total, self.batch_size)]
+        results = [None] * len(batches)
+        done = 0
+        start = time.time()
+        self._report(0, total, start)
+
+        # 在途批次数限制为线程数的两倍，避免一次性把所有请求压到 Ollama
+        max_in_flight = self.max_workers * 2
+        pending = {}
+        next_batch = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while next_batch < len(batches) or pending:
+                while next_batch < len(batches) and len(pending) < max_in_flight:
+                    future = pool.submit(self._embed_batch, batches[next_batch])
+                    pending[future] = next_batch
+                    next_batch += 1
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index = pending.pop(future)
+                    results[index] = future.result()
+                    done += len(batches[index])
+                    self._report(done, total, start)
+
+        return [vector for batch in results for vector in batch]
+
+    def embed_query(self, text: str, stats: dict = None) -> List[float]:
+        return self.client.embed(self.model, text, stats)
+
+    def _report(self, done: int, total: int, start: float):
+        elapsed = time.time() - start
+        self.last_throughput = done / elapsed if elapsed > 0 else 0.0
+        if self.progress_callback:
+            self.progress_callback(done, total, self.last_throughput)
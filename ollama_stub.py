@@ -0,0 +1,374 @@
+"""
+本地 Ollama 替身服务
+
+实现 /api/embeddings、/api/generate（流式）和 /api/tags，返回确定性的伪向量和伪回答，
+用于基准测试、持续集成和负载测试，不需要真实模型和网络。伪向量由文本中的词和中文二元组做特征哈希得到，
+相近的文本向量也相近，检索结果有意义且每次运行完全一致。
+
+延迟、并发和流式行为都可以配置，用来单独测量本项目自身的开销，或模拟慢速、过载的 Ollama：
+- --embed-latency / --token-latency / --first-token-latency：向量化延迟、token 间隔和首个 token 前的延迟（模拟加载模型）
+- --jitter：延迟按 ±比例随机抖动
+- --concurrency / --max-queue：同时处理的请求数和排队上限，超出排队上限返回 503（与 OLLAMA_NUM_PARALLEL / OLLAMA_MAX_QUEUE 类似）
+- --error-rate：按比例返回 500，用于测试重试
+- --tokens / --tokens-per-chunk：回答长度和每个流式分块包含的 token 数
+- --load-latency：模型未加载时的加载耗时；与 Ollama 一样按请求中的 keep_alive（默认 5 分钟）在空闲后卸载模型，
+  生成结果的 load_duration 字段反映是否发生了加载，不带 prompt 的生成请求只加载模型
+GET /stub/stats 返回请求数、排队、拒绝、中止的生成等统计。
+
+用法：
+    python ollama_stub.py --port 11434
+    python ollama_stub.py --port 11434 --embed-latency 0.02 --token-latency 0.03
+    python ollama_stub.py --port 11500 --concurrency 1 --max-queue 4 --first-token-latency 2
+    OLLAMA_BASE_URL=http://127.0.0.1:11500 streamlit run chatbot.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+DURATION_PATTERN = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}
+WORD_PATTERN = re.compile(r"[A-Za-z0-9_]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+")
+
+
+def parse_keep_alive(value, default: float = 300.0) -> float:
+    """keep_alive 转为秒：数字为秒，字符串如 "30m"、"1h"，负数表示一直保留"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        match = DURATION_PATTERN.match(str(value).strip())
+        if not match:
+            return default
+        seconds = float(match.group(1)) * DURATION_UNITS[match.group(2)]
+    return float("inf") if seconds < 0 else seconds
+
+
+def pseudo_embedding(text: str, dim: int = 256) -> list:
+    """确定性伪向量：英文词和中文二元组哈希到 dim 个桶（带符号），再归一化"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for match in WORD_PATTERN.finditer(text.lower()):
+        word = match.group(0)
+        features = [word] if word.isascii() else [word[i:i + 2] for i in range(max(1, len(word) - 1))]
+        for feature in features:
+            digest = hashlib.md5(feature.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 关闭 Nagle 算法，否则小响应会因延迟确认多等约 40ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _known_model(self, name):
+        return name in self.server.models or f"{name}:latest" in self.server.models
+
+    def do_GET(self):
+        if self.path == "/stub/stats":
+            self._send_json(self.server.snapshot())
+        elif self.path in ("/", ""):
+            data = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif self.path == "/api/tags":
+            self._send_json({"models": [{"name": name, "model": name} for name in self.server.models]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        body = self._read_json()
+        handler = {"/api/embeddings": self.handle_embeddings, "/api/generate": self.handle_generate}.get(self.path)
+        if handler is None:
+            self._send_json({"error": "not found"}, 404)
+            return
+        if not self._known_model(body.get("model", "")):
+            self._send_json({"error": f"model '{body.get('model')}' not found"}, 404)
+            return
+        self.server.count(self.path)
+        # 按配置的并发数排队，排队过长时像 Ollama 一样返回 503
+        if not self.server.admit():
+            self.server.count("rejected")
+            self._send_json({"error": "server busy, please try again"}, 503)
+            return
+        try:
+            if self.server.should_fail():
+                self.server.count("failed")
+                self._send_json({"error": "simulated failure"}, 500)
+                return
+            body["load_duration"] = self.server.load_model(body["model"], body.get("keep_alive"))
+            handler(body)
+        finally:
+            self.server.release()
+
+    def handle_embeddings(self, body):
+        if not body.get("prompt"):
+            # 空 prompt 只加载模型
+            self._send_json({"embedding": []})
+            return
+        self.server.sleep(self.server.embed_latency)
+        self._send_json({"embedding": pseudo_embedding(body.get("prompt", ""), self.server.dim)})
+
+    def handle_generate(self, body):
+        load_duration = int(body["load_duration"] * 1e9)
+        if "prompt" not in body:
+            # 不带 prompt 的请求只加载模型
+            self._send_json({"model": body["model"], "response": "", "done": True, "done_reason": "load", "load_duration": load_duration})
+            return
+        # 伪回答：从提示词哈希确定性地选出 tokens 个词
+        seed = int.from_bytes(hashlib.sha256(body.get("prompt", "").encode("utf-8")).digest()[:8], "little")
+        words = WORD_PATTERN.findall(body.get("prompt", "")) or ["ok"]
+        rng = np.random.default_rng(seed)
+        tokens = [words[i] + " " for i in rng.integers(0, len(words), self.server.tokens)]
+
+        self.server.sleep(self.server.first_token_latency)
+        if not body.get("stream", True):
+            self.server.sleep(self.server.token_latency * len(tokens))
+            self._send_json({"model": body["model"], "response": "".join(tokens), "done": True, "load_duration": load_duration})
+            self.server.count("completed")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        size = self.server.tokens_per_chunk
+        try:
+            for i in range(0, len(tokens), size):
+                self.server.sleep(self.server.token_latency * len(tokens[i:i + size]))
+                self._write_chunk({"model": body["model"], "response": "".join(tokens[i:i + size]), "done": False})
+            self._write_chunk({"model": body["model"], "response": "", "done": True, "load_duration": load_duration, "eval_count": len(tokens)})
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+            self.server.count("completed")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端断开（用户点击停止），停止生成
+            self.server.count("aborted")
+            self.close_connection = True
+
+    def _write_chunk(self, payload):
+        line = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+
+# 替身服务的 HTTP 服务器，保存配置、并发控制和统计
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def configure(
+        self,
+        dim: int = 256,
+        embed_latency: float = 0.0,
+        token_latency: float = 0.0,
+        first_token_latency: float = 0.0,
+        jitter: float = 0.0,
+        tokens: int = 32,
+        tokens_per_chunk: int = 1,
+        concurrency: int = 0,
+        max_queue: int = 0,
+        error_rate: float = 0.0,
+        load_latency: float = 0.0,
+        seed: int = 0,
+        models=("llama2:latest",)
+    ):
+        self.dim = dim  # 伪向量维度
+        self.embed_latency = embed_latency  # 每次向量化请求的延迟（秒）
+        self.token_latency = token_latency  # 每个 token 的生成间隔（秒）
+        self.first_token_latency = first_token_latency  # 首个 token 前的额外延迟（秒）
+        self.jitter = jitter  # 延迟随机抖动比例，0.2 表示 ±20%
+        self.tokens = tokens  # 每个回答的 token 数
+        self.tokens_per_chunk = max(1, tokens_per_chunk)  # 每个流式分块的 token 数
+        self.concurrency = concurrency  # 同时处理的请求数，0 表示不限制
+        self.max_queue = max_queue  # 排队请求上限，0 表示不限制
+        self.error_rate = error_rate  # 返回 500 的请求比例
+        self.load_latency = load_latency  # 模型未加载时的加载耗时（秒）
+        self._loaded_until = {}  # 模型 -> 卸载时间
+        self._load_locks = {}  # 模型 -> 加载锁，并发请求只加载一次
+        self.models = list(models)
+        self._random = random.Random(seed)
+        self._slots = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._queued = 0
+        self._active = 0
+        self._peak_active = 0
+        self._peak_queued = 0
+
+    def sleep(self, seconds: float):
+        if seconds <= 0:
+            return
+        if self.jitter:
+            with self._lock:
+                seconds *= self._random.uniform(1 - self.jitter, 1 + self.jitter)
+        time.sleep(seconds)
+
+    def load_model(self, model: str, keep_alive) -> float:
+        """模型未加载（或已超过 keep_alive 被卸载）时模拟加载，返回本次请求的加载耗时（秒）"""
+        name = model if ":" in model else f"{model}:latest"
+        with self._lock:
+            lock = self._load_locks.setdefault(name, threading.Lock())
+        start = time.perf_counter()
+        with lock:
+            if time.time() >= self._loaded_until.get(name, 0):
+                self.count("loads")
+                self.sleep(self.load_latency)
+            # 与 Ollama 一样，每次请求都按本次的 keep_alive 重新计算卸载时间
+            self._loaded_until[name] = time.time() + parse_keep_alive(keep_alive)
+            return time.perf_counter() - start
+
+    def should_fail(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def admit(self) -> bool:
+        """占用一个处理槽位，排队已满时返回 False"""
+        with self._lock:
+            if self.max_queue and self._slots is not None and self._queued >= self.max_queue and self._active >= self.concurrency:
+                return False
+            self._queued += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+        if self._slots is not None:
+            self._slots.acquire()
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._peak_active = max(self._peak_active, self._active)
+        return True
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": dict(self._counters),
+                "active": self._active,
+                "queued": self._queued,
+                "peak_active": self._peak_active,
+                "peak_queued": self._peak_queued
+            }
+
+    def handle_error(self, request, client_address):
+        # 客户端主动断开连接（取消生成、关闭连接池）属于正常情况，不打印堆栈
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+# 在后台线程中运行的替身服务，port=0 时自动选择空闲端口，其余参数见 StubHTTPServer.configure
+class OllamaStub:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **config):
+        self.server = StubHTTPServer((host, port), OllamaStubHandler)
+        self.server.configure(**config)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stats(self) -> dict:
+        return self.server.snapshot()
+
+    def start(self) -> "OllamaStub":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama 替身服务（确定性伪向量和伪回答）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--dim", type=int, default=256, help="伪向量维度")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="每次向量化请求的延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="每个 token 的生成间隔（秒）")
+    parser.add_argument("--first-token-latency", type=float, default=0.0, help="首个 token 前的额外延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机抖动比例，如 0.2 表示 ±20%%")
+    parser.add_argument("--tokens", type=int, default=32, help="每个回答的 token 数")
+    parser.add_argument("--tokens-per-chunk", type=int, default=1, help="每个流式分块的 token 数")
+    parser.add_argument("--concurrency", type=int, default=0, help="同时处理的请求数，0 表示不限制")
+    parser.add_argument("--max-queue", type=int, default=0, help="排队请求上限，超出返回 503，0 表示不限制")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的请求比例")
+    parser.add_argument("--load-latency", type=float, default=0.0, help="模型未加载时的加载耗时（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="抖动和错误注入的随机种子")
+    parser.add_argument("--model", action="append", help="可用模型，可重复指定，默认 llama2:latest")
+    args = parser.parse_args()
+
+    stub = OllamaStub(
+        args.host,
+        args.port,
+        dim=args.dim,
+        embed_latency=args.embed_latency,
+        token_latency=args.token_latency,
+        first_token_latency=args.first_token_latency,
+        jitter=args.jitter,
+        tokens=args.tokens,
+        tokens_per_chunk=args.tokens_per_chunk,
+        concurrency=args.concurrency,
+        max_queue=args.max_queue,
+        error_rate=args.error_rate,
+        load_latency=args.load_latency,
+        seed=args.seed,
+        models=args.model or ("llama2:latest",)
+    )
+    print(f"Ollama 替身服务运行在 {stub.url}", flush=True)
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
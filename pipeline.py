@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def ordered_map(func: Callable[[T], R], items: Iterable[T], max_workers: int = 4, window: int = None) -> Iterator[R]:
+    """在线程池中并发执行 func，按输入顺序逐个产出结果
+
+    同一时刻最多有 window 个任务在途（默认线程数的两倍），输入按需读取，
+    因此内存占用只取决于窗口大小而不是输入总量；消费方处理结果时后续任务继续在后台执行。
+    """
+    window = window or max_workers * 2
+    items = iter(items)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        try:
+            for item in items:
+                pending.append(pool.submit(func, item))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # 消费方提前退出或出错时取消尚未开始的任务
+            for future in pending:
+                future.cancel()
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """把输入按 size 分批，最后一批可能不足 size"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,90 @@
+import sys
+import time
+
+
+# 构建和更新过程中的消息输出接口：Web 界面输出到 Streamlit，命令行输出到终端
+# main 指向需要醒目显示的位置（界面中为主区域，命令行中与自身相同）
+class Reporter:
+    def __init__(self):
+        self.main = self
+
+    def write(self, message: str):
+        pass
+
+    def info(self, message: str):
+        pass
+
+    def success(self, message: str):
+        pass
+
+    def warning(self, message: str):
+        pass
+
+    def error(self, message: str):
+        pass
+
+    def progress(self, key: str, done: int, total: int, message: str):
+        """更新名为 key 的进度，同一个 key 的进度在同一位置刷新"""
+        pass
+
+    def end_progress(self, key: str):
+        """结束名为 key 的进度，下次更新时重新开始"""
+        pass
+
+
+# 终端输出：交互式终端中显示原地刷新的进度条，重定向到文件时每 10% 输出一行
+class ConsoleReporter(Reporter):
+    def __init__(self, stream=None, verbose: bool = False, bar_width: int = 30):
+        super().__init__()
+        self.stream = stream or sys.stderr
+        self.verbose = verbose  # 是否输出逐个文件的详细信息
+        self.bar_width = bar_width
+        self.interactive = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self._active = None  # 当前占用进度行的 key
+        self._last_step = {}
+
+    def _print(self, prefix: str, message: str):
+        self._clear_line()
+        print(f"{prefix}{message}", file=self.stream, flush=True)
+
+    def write(self, message: str):
+        if self.verbose:
+            self._print("", message)
+
+    def info(self, message: str):
+        if self.verbose:
+            self._print("[信息] ", message)
+
+    def success(self, message: str):
+        self._print("[完成] ", message)
+
+    def warning(self, message: str):
+        self._print("[警告] ", message)
+
+    def error(self, message: str):
+        self._print("[错误] ", message)
+
+    def progress(self, key: str, done: int, total: int, message: str):
+        fraction = done / total if total else 1.0
+        if self.interactive:
+            filled = int(self.bar_width * fraction)
+            bar = "█" * filled + "-" * (self.bar_width - filled)
+            self.stream.write(f"\r\033[K[{bar}] {fraction * 100:5.1f}% {message}")
+            self.stream.flush()
+            self._active = key
+        else:
+            step = int(fraction * 10)
+            if step != self._last_step.get(key):
+                self._last_step[key] = step
+                print(f"[进度] {time.strftime('%H:%M:%S')} {message}", file=self.stream, flush=True)
+
+    def end_progress(self, key: str):
+        self._last_step.pop(key, None)
+        if self._active == key:
+            self._clear_line()
+
+    def _clear_line(self):
+        if self._active is not None:
+            self.stream.write("\r\033[K")
+            self.stream.flush()
+            self._active = None
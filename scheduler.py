@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+INTERACTIVE = "interactive"  # 用户提问：问题向量化和回答生成
+BACKGROUND = "background"  # 构建和更新索引时的批量向量化
+LANES = (INTERACTIVE, BACKGROUND)  # 按优先级排列
+
+
+# 排队超过期限
+class QueueTimeout(Exception):
+    pass
+
+
+# 排队期间请求被取消（停止按钮或会话已离开）
+class RequestCancelled(Exception):
+    pass
+
+
+class Ticket:
+    __slots__ = ("lane", "created", "started")
+
+    def __init__(self, lane: str):
+        self.lane = lane
+        self.created = time.monotonic()
+        self.started = None
+
+    @property
+    def waited(self) -> float:
+        """排队等待的秒数"""
+        return (self.started or time.monotonic()) - self.created
+
+
+# Ollama 请求调度：进程内所有会话共用 max_concurrency 个槽位，超出的请求排队
+# 同一通道内先进先出；有空闲槽位时先放行 interactive 通道，索引重建不会让用户提问一直排队
+class Scheduler:
+    def __init__(self, max_concurrency: int = 4, poll_interval: float = 0.5):
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval  # 排队时检查取消、期限并回调位置的间隔（秒）
+        self._cond = threading.Condition()
+        self._queues = {lane: deque() for lane in LANES}
+        self._active = {lane: 0 for lane in LANES}
+        self.timeouts = 0
+        self.cancelled = 0
+
+    @contextmanager
+    def slot(
+        self,
+        lane: str = INTERACTIVE,
+        timeout: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+        on_wait: Optional[Callable[[int], None]] = None
+    ):
+        """占用一个槽位执行请求：with scheduler.slot(INTERACTIVE, timeout=60): ...
+
+        排队期间每隔 poll_interval 调用 on_wait(前面的请求数 + 1)；超过 timeout 抛出 QueueTimeout，
+        cancel_event 被设置时抛出 RequestCancelled；on_wait 抛出的异常（如 Streamlit 会话已结束）同样会让请求出队
+        """
+        ticket = self._acquire(lane, timeout, cancel_event, on_wait)
+        try:
+            yield ticket
+        finally:
+            with self._cond:
+                self._active[lane] -= 1
+                self._cond.notify_all()
+
+    def _acquire(self, lane, timeout, cancel_event, on_wait) -> Ticket:
+        ticket = Ticket(lane)
+        deadline = ticket.created + timeout if timeout is not None else None
+        with self._cond:
+            self._queues[lane].append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    if self._next() is ticket:
+                        self._queues[lane].popleft()
+                        self._active[lane] += 1
+                        ticket.started = time.monotonic()
+                        return ticket
+                    if cancel_event is not None and cancel_event.is_set():
+                        self.cancelled += 1
+                        raise RequestCancelled("请求已取消")
+                    if deadline is not None and time.monotonic() > deadline:
+                        self.timeouts += 1
+                        raise QueueTimeout(f"排队超过 {timeout:.0f} 秒，服务繁忙，请稍后重试")
+                    position = self._position(ticket)
+                # 回调不持有锁（界面刷新可能较慢或抛出异常）
+                if on_wait is not None:
+                    on_wait(position)
+                with self._cond:
+                    if self._next() is not ticket:
+                        self._cond.wait(self.poll_interval)
+        except BaseException:
+            with self._cond:
+                if ticket in self._queues[lane]:
+                    self._queues[lane].remove(ticket)
+                    self._cond.notify_all()
+            raise
+
+    def _next(self) -> Optional[Ticket]:
+        """下一个可以开始的请求：有空闲槽位时取优先级最高的非空通道的队首"""
+        if sum(self._active.values()) >= self.max_concurrency:
+            return None
+        for lane in LANES:
+            if self._queues[lane]:
+                return self._queues[lane][0]
+        return None
+
+    def _position(self, ticket: Ticket) -> int:
+        """排队位置，1 表示下一个"""
+        ahead = 0
+        for lane in LANES:
+            queue = self._queues[lane]
+            if lane == ticket.lane:
+                return ahead + queue.index(ticket) + 1
+            ahead += len(queue)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "active": dict(self._active),
+                "queued": {lane: len(queue) for lane, queue in self._queues.items()},
+                "timeouts": self.timeouts,
+                "cancelled": self.cancelled
+            }
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import time
+from typing import List, Optional, Tuple
+
+POINTER_FILE = "CURRENT"  # 记录当前版本名的指针文件
+STAGING_SUFFIX = ".staging"  # 写入中的版本目录（写完后改名）和构建工作目录的后缀
+STALE_STAGING_SECONDS = 3600  # 超过该时长没有写入的暂存目录和构建工作目录视为中断的构建，清理时删除
+LEGACY_FILES = ("index.faiss", "index.pkl")  # 引入快照之前直接保存在根目录下的 LangChain FAISS 索引（pickle 格式）
+
+
+def version_number(name: str) -> int:
+    """版本名（或其暂存目录名）中的发布序号，构建工作目录等其他名称为 0"""
+    number = name[:-len(STAGING_SUFFIX)] if name.endswith(STAGING_SUFFIX) else name
+    return int(number) if number.isdigit() else 0
+
+
+# 向量存储的版本快照：每次构建写入 snapshots/<版本>/，写完后原子替换 CURRENT 指针发布，
+# 读取方只看指针，构建中途崩溃或查询与构建同时进行都不会读到写了一半的索引；保留最近 keep 个版本用于回滚
+class SnapshotStore:
+    def __init__(self, root: str, keep: int = 3):
+        self.root = root
+        self.keep = keep  # 保留的版本数（当前版本总是保留）
+        self.snapshots_path = os.path.join(root, "snapshots")
+        self.pointer_path = os.path.join(root, POINTER_FILE)
+
+    def path(self, version: str) -> str:
+        return os.path.join(self.snapshots_path, version)
+
+    def current_version(self) -> Optional[str]:
+        try:
+            with open(self.pointer_path, "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current_path(self) -> Optional[str]:
+        """当前版本的目录，还没有发布过版本时返回 None"""
+        version = self.current_version()
+        return self.path(version) if version else None
+
+    def versions(self) -> List[str]:
+        """已发布的版本，按发布序号从旧到新排列"""
+        if not os.path.isdir(self.snapshots_path):
+            return []
+        return sorted(
+            (name for name in os.listdir(self.snapshots_path)
+             if not name.endswith(STAGING_SUFFIX) and os.path.isdir(self.path(name))),
+            key=version_number
+        )
+
+    def stage(self) -> Tuple[str, str]:
+        """创建新版本的暂存目录，返回 (版本名, 暂存目录)；版本名是递增的发布序号，同一秒内发布的版本也能排出先后"""
+        os.makedirs(self.snapshots_path, exist_ok=True)
+        while True:
+            number = max((version_number(name) for name in os.listdir(self.snapshots_path)), default=0) + 1
+            version = f"{number:06d}"
+            staging = self.path(version) + STAGING_SUFFIX
+            try:
+                os.makedirs(staging)
+            except FileExistsError:
+                # 另一个进程同时占用了这个序号
+                continue
+            return version, staging
+
+    def workspace(self) -> str:
+        """创建构建工作目录：新建的分片先按批写在这里，保存版本时硬链接进暂存目录，发布后由调用方删除"""
+        os.makedirs(self.snapshots_path, exist_ok=True)
+        return tempfile.mkdtemp(prefix="build-", suffix=STAGING_SUFFIX, dir=self.snapshots_path)
+
+    def link_tree(self, source: str, target: str):
+        """把上一版本中未变化的分片以硬链接放入新版本（已发布的文件不再修改，共用不占额外磁盘），不支持硬链接时复制"""
+        os.makedirs(target, exist_ok=True)
+        for name in os.listdir(source):
+            source_path = os.path.join(source, name)
+            target_path = os.path.join(target, name)
+            if os.path.isdir(source_path):
+                self.link_tree(source_path, target_path)
+                continue
+            try:
+                os.link(source_path, target_path)
+            except OSError:
+                shutil.copy2(source_path, target_path)
+
+    def publish(self, version: str, staging: str) -> str:
+        """暂存目录改名为正式版本，再原子替换指针；返回版本目录"""
+        path = self.path(version)
+        os.replace(staging, path)
+        self.set_current(version)
+        self.remove_legacy()
+        self.prune()
+        return path
+
+    def discard(self, staging: str):
+        shutil.rmtree(staging, ignore_errors=True)
+
+    def set_current(self, version: str):
+        """原子替换指针（写临时文件后 os.replace），用于发布和回滚"""
+        if not os.path.isdir(self.path(version)):
+            raise FileNotFoundError(f"版本不存在：{version}")
+        tmp_path = self.pointer_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.pointer_path)
+
+    def prune(self):
+        """只保留最近 keep 个版本和当前版本，并清理中断的暂存目录；文件仍被其他进程占用而删除失败时下次再试"""
+        current = self.current_version()
+        versions = self.versions()
+        for version in versions[:max(0, len(versions) - self.keep)]:
+            if version != current:
+                shutil.rmtree(self.path(version), ignore_errors=True)
+        for name in os.listdir(self.snapshots_path):
+            path = self.path(name)
+            if name.endswith(STAGING_SUFFIX) and time.time() - self.last_modified(path) > STALE_STAGING_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def last_modified(self, path: str) -> float:
+        """目录中最近一次写入的时间（构建工作目录中的文件持续追加写入，目录本身的修改时间不变）"""
+        latest = os.path.getmtime(path)
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+                except OSError:
+                    continue
+        return latest
+
+    def remove_legacy(self):
+        """删除引入快照之前保存在根目录下的索引（不再加载，发布第一个版本后清理）"""
+        for name in LEGACY_FILES:
+            path = os.path.join(self.root, name)
+            if os.path.exists(path):
+                os.remove(path)
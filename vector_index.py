@@ -0,0 +1,234 @@
+import os
+
+import faiss
+import numpy as np
+
+# 支持的索引类型：flat 为精确检索，其余为近似检索
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq")
+# 向量的存储精度：float32 为原始向量，float16 / int8 为标量量化（每维 2 / 1 字节），pq 索引自带编码，不受此参数影响
+ENCODINGS = ("float32", "float16", "int8")
+# 降维方式：pca 在构建时用本分片的向量训练，random 为随机正交投影（不需要训练）
+REDUCE_METHODS = ("pca", "random")
+
+# 各索引类型的默认调优参数
+DEFAULT_INDEX_PARAMS = {
+    "nlist": 256,  # IVF 聚类中心数，片段较少时自动下调
+    "nprobe": 16,  # IVF 查询时检索的聚类数
+    "hnsw_m": 32,  # HNSW 每个节点的邻居数
+    "ef_construction": 80,  # HNSW 构建时的候选队列长度
+    "ef_search": 64,  # HNSW 查询时的候选队列长度
+    "pq_m": 64,  # PQ 子向量个数，需要整除向量维度
+    "pq_bits": 8,  # 每个子向量的编码位数
+    "encoding": "float32",  # 向量存储精度，见 ENCODINGS
+    "reduce_dim": 0,  # 降维后的维度，0 表示不降维
+    "reduce_method": "pca"  # 降维方式，见 REDUCE_METHODS
+}
+SEARCH_PARAMS = ("nprobe", "ef_search")  # 只在查询时生效的参数，修改后不需要重建索引
+
+
+def _quantizer_type(encoding: str):
+    return {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}[encoding]
+
+
+def check_params(index_type: str, params: dict):
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型：{index_type}，可选：{', '.join(INDEX_TYPES)}")
+    if params["encoding"] not in ENCODINGS:
+        raise ValueError(f"不支持的向量精度：{params['encoding']}，可选：{', '.join(ENCODINGS)}")
+    if params["reduce_method"] not in REDUCE_METHODS:
+        raise ValueError(f"不支持的降维方式：{params['reduce_method']}，可选：{', '.join(REDUCE_METHODS)}")
+
+
+def needs_training(index_type: str, params: dict = None) -> bool:
+    """构建前是否需要在完整数据上训练（IVF 聚类、PQ 码本、int8 取值范围、PCA）"""
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    return index_type in ("ivf", "pq") or params["encoding"] == "int8" or bool(params["reduce_dim"])
+
+
+def build_index(vectors: np.ndarray, index_type: str = "flat", params: dict = None) -> faiss.Index:
+    """按索引类型创建、训练并填充 FAISS 索引（使用 L2 距离，与 LangChain FAISS 默认一致）
+
+    设置 reduce_dim 时先降维（IndexPreTransform，查询向量和新增向量自动经过同一变换），
+    encoding 为 float16 / int8 时用标量量化保存向量
+    """
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    check_params(index_type, params)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+
+    transform = None
+    reduce_dim = params["reduce_dim"]
+    # PCA 至少需要 reduce_dim 个样本，片段太少的分片不降维
+    if reduce_dim and reduce_dim < dim and (params["reduce_method"] == "random" or count >= reduce_dim):
+        if params["reduce_method"] == "pca":
+            transform = faiss.PCAMatrix(dim, reduce_dim)
+        else:
+            transform = faiss.RandomRotationMatrix(dim, reduce_dim)
+        transform.train(vectors)
+        index = _create_index(transform.apply(vectors), index_type, params)
+        index = faiss.IndexPreTransform(transform, index)
+    else:
+        index = _create_index(vectors, index_type, params)
+
+    index.add(vectors)
+    configure_search(index, params)
+    return index
+
+
+def _create_index(vectors: np.ndarray, index_type: str, params: dict) -> faiss.Index:
+    """创建并训练（不填充）索引，vectors 为降维后的训练数据"""
+    count, dim = vectors.shape
+    encoding = params["encoding"]
+
+    if index_type == "ivf":
+        # 每个聚类中心至少需要约 39 个训练样本
+        nlist = max(1, min(params["nlist"], count // 39))
+        quantizer = faiss.IndexFlatL2(dim)
+        if encoding == "float32":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, _quantizer_type(encoding), faiss.METRIC_L2)
+        index.train(vectors)
+        # 需要按位置取回向量（跨语言回退和 MMR 时计算余弦相似度）
+        index.make_direct_map()
+    elif index_type == "hnsw":
+        if encoding == "float32":
+            index = faiss.IndexHNSWFlat(dim, params["hnsw_m"])
+        else:
+            index = faiss.IndexHNSWSQ(dim, _quantizer_type(encoding), params["hnsw_m"])
+            index.train(vectors)
+        index.hnsw.efConstruction = params["ef_construction"]
+    elif index_type == "pq" and count >= 2 ** params["pq_bits"]:
+        pq_m = params["pq_m"]
+        # 子向量个数必须整除维度，不满足时取不超过 pq_m 的最大因子
+        while dim % pq_m:
+            pq_m -= 1
+        index = faiss.IndexPQ(dim, pq_m, params["pq_bits"])
+        index.train(vectors)
+    elif encoding != "float32":
+        # flat 标量量化，或片段太少不足以训练 PQ 码本
+        index = faiss.IndexScalarQuantizer(dim, _quantizer_type(encoding), faiss.METRIC_L2)
+        index.train(vectors)
+    else:
+        index = faiss.IndexFlatL2(dim)
+    return index
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """去掉降维变换后的索引"""
+    if isinstance(index, faiss.IndexPreTransform):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def build_config(index_type: str, params: dict = None) -> tuple:
+    """决定索引结构的配置（索引类型和除查询参数外的全部参数，未指定的取默认值），用于判断两份配置构建的索引是否相同"""
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    return index_type, {key: value for key, value in params.items() if key not in SEARCH_PARAMS}
+
+
+def configure_search(index: faiss.Index, params: dict = None):
+    """设置查询阶段的参数（nprobe / efSearch）"""
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    index = base_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(params["nprobe"], index.nlist)
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = params["ef_search"]
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """识别已有索引的类型（标量量化的精确索引也视为 flat）"""
+    index = base_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexPQ):
+        return "pq"
+    return "flat"
+
+
+def index_encoding_of(index: faiss.Index) -> str:
+    """已有索引的向量存储方式，如 float32、int8、pq，降维时附加 "+pca/512" 之类的说明"""
+    base = base_index(index)
+    if isinstance(base, faiss.IndexPQ):
+        encoding = "pq"
+    else:
+        storage = faiss.downcast_index(base.storage) if isinstance(base, faiss.IndexHNSW) else base
+        sq = getattr(storage, "sq", None)
+        if sq is None:
+            encoding = "float32"
+        else:
+            encoding = "float16" if sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    if isinstance(index, faiss.IndexPreTransform):
+        transform = faiss.downcast_VectorTransform(index.chain.at(0))
+        method = "pca" if isinstance(transform, faiss.PCAMatrix) else "random"
+        encoding += f"+{method}/{transform.d_out}"
+    return encoding
+
+
+def supports_incremental(index: faiss.Index) -> bool:
+    """是否支持按位置删除并保持位置连续（LangChain FAISS.delete 依赖这一点）"""
+    return index_type_of(index) in ("flat", "pq")
+
+
+def index_size_bytes(index: faiss.Index) -> int:
+    """索引序列化后的大小，近似等于常驻内存大小"""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def read_index(path: str, mmap: bool = True) -> faiss.Index:
+    """读取索引；mmap=True 时以只读内存映射方式打开，多个进程通过页缓存共享同一份向量"""
+    if not mmap:
+        return faiss.read_index(path)
+    # Flat/PQ/HNSW 的向量存储用 IO_FLAG_MMAP_IFC 映射，IVF 的倒排表用 IO_FLAG_MMAP 映射；旧版 faiss 不支持时退回普通读取
+    for flag_names in (("IO_FLAG_MMAP_IFC", "IO_FLAG_READ_ONLY"), ("IO_FLAG_MMAP", "IO_FLAG_READ_ONLY")):
+        if not all(hasattr(faiss, name) for name in flag_names):
+            continue
+        flags = 0
+        for name in flag_names:
+            flags |= getattr(faiss, name)
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError:
+            continue
+    return faiss.read_index(path)
+
+
+def write_index(index: faiss.Index, path: str):
+    """先写临时文件再替换，避免读取到写了一半的索引"""
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+# 分批追加向量的索引构建器：flat / hnsw 每批直接加入索引；ivf / pq、int8 量化和降维需要在完整数据上训练，
+# 向量先暂存，finish() 时一次性训练并构建（暂存的向量与最终索引同一数量级）
+class IndexBuilder:
+    def __init__(self, index_type: str = "flat", params: dict = None):
+        check_params(index_type, {**DEFAULT_INDEX_PARAMS, **(params or {})})
+        self.index_type = index_type
+        self.params = params
+        self.index = None
+        self._pending = []
+        self.ntotal = 0
+
+    def add(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        self.ntotal += len(vectors)
+        if needs_training(self.index_type, self.params):
+            self._pending.append(vectors)
+        elif self.index is None:
+            self.index = build_index(vectors, self.index_type, self.params)
+        else:
+            self.index.add(vectors)
+
+    def finish(self) -> faiss.Index:
+        if self._pending:
+            self.index = build_index(np.vstack(self._pending), self.index_type, self.params)
+            self._pending = []
+        if self.index is None:
+            raise ValueError("没有向量，无法构建索引")
+        return self.index
@@ -0,0 +1,65 @@
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import requests
+
+from metrics import Metrics
+from ollama_client import OllamaClient
+from scheduler import Scheduler, BACKGROUND
+
+
+# 模型预热：在后台线程中让 Ollama 加载向量模型和生成模型，避免空闲后的第一个问题承担加载耗时
+# interval > 0 时在工作时间（days 中的星期、hours 中的小时段）内定期重新发送加载请求，刷新 keep_alive
+class ModelWarmer:
+    def __init__(
+        self,
+        client: OllamaClient,
+        models: List[Tuple[str, bool]],
+        scheduler: Optional[Scheduler] = None,
+        metrics: Optional[Metrics] = None,
+        interval: float = 0,
+        hours: Tuple[int, int] = (9, 18),
+        days: Tuple[int, ...] = (0, 1, 2, 3, 4)
+    ):
+        self.client = client
+        self.models = models  # [(模型名, 是否为向量模型)]
+        self.scheduler = scheduler
+        self.metrics = metrics or Metrics(enabled=False)
+        self.interval = interval  # 保活请求间隔（秒），0 表示只在启动时预热一次
+        self.hours = hours  # 发送保活请求的小时段 [开始, 结束)
+        self.days = days  # 发送保活请求的星期（0 为周一）
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> "ModelWarmer":
+        self._thread = threading.Thread(target=self._run, name="model-warmer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def warm(self):
+        """依次加载各模型；失败只计数，不影响问答（第一次提问时 Ollama 仍会加载模型）"""
+        for model, embedding in self.models:
+            try:
+                with self.scheduler.slot(BACKGROUND) if self.scheduler else nullcontext():
+                    seconds = self.client.load(model, embedding)
+                self.metrics.observe_stage("warmup.load", seconds)
+                self.metrics.incr("warmup.requests")
+            except requests.RequestException:
+                self.metrics.incr("warmup.failures")
+
+    def in_business_hours(self, now: datetime = None) -> bool:
+        now = now or datetime.now()
+        return now.weekday() in self.days and self.hours[0] <= now.hour < self.hours[1]
+
+    def _run(self):
+        self.warm()
+        if not self.interval:
+            return
+        while not self._stop.wait(self.interval):
+            if self.in_business_hours():
+                self.warm()